@@ -5,11 +5,13 @@ import json
 import argparse
 import numpy as np
 import pandas as pd
-from sklearn.cluster import KMeans
 from sklearn.preprocessing import StandardScaler
-from sklearn.decomposition import PCA
+from scipy import sparse
 import sys
 from collections import defaultdict
+import ingestion
+import features as feature_store
+import segmentation
 
 # Mapping des programmes de fidélité par catégorie de produit
 PRODUCT_LOYALTY_MAPPING = {
@@ -51,131 +53,79 @@ PRODUCT_LOYALTY_MAPPING = {
     }
 }
 
-def load_data(loyalty_path, purchases_path):
+# Niveaux de détail des données de visualisation : tous les points, échantillon stratifié ou grilles de densité
+LOD_MODES = ('full', 'sample', 'grid')
+DEFAULT_MAX_POINTS = 5000
+GRID_BINS = 50
+
+def load_data(loyalty_path, purchases_path, **ingest_options):
     """Load and merge customer data from loyalty and purchases JSON files."""
     try:
-        # Load loyalty data
-        with open(loyalty_path, 'r', encoding='utf-8') as f:
-            loyalty_data = json.load(f)
-        
-        # Load purchases data
-        with open(purchases_path, 'r', encoding='utf-8') as f:
-            purchases_data = json.load(f)
-        
-        # Convert to pandas DataFrames
-        loyalty_df = pd.DataFrame(loyalty_data)
+        # Load the per-customer feature table and the purchase aggregates
+        table, aggregates = feature_store.load_feature_table(loyalty_path, purchases_path, **ingest_options)
         
-        # Extract basic purchase info and product categories
-        purchase_info = []
+        # Préférences globales de chaque client : dépense totale par catégorie
         product_preferences = defaultdict(lambda: defaultdict(float))
+        category_spend = aggregates['category_spend']
+        for client_id, category, amount in zip(
+                category_spend['client_id'], category_spend['categorie'], category_spend['amount']):
+            product_preferences[client_id][category] = amount
         
-        for purchase in purchases_data:
-            client_id = purchase.get('Client_ID')
-            age = purchase.get('Âge', 0)
-            sexe = purchase.get('Sexe', '')
-            total_achat = purchase.get('Total_Achat (€)', 0)
-            nombre_produits = purchase.get('Nombre_Produits', 0)
-            
-            # Extract product categories
-            product_categories = {}
-            if 'Produits' in purchase and client_id:
-                for product in purchase['Produits']:
-                    # Récupération de la catégorie du produit
-                    category = product.get('Catégorie', 'Autre')
-                    cost = product.get('Total_Coût_Produit (€)', 0)
-                    
-                    # Ajouter au total par catégorie
-                    if category in product_categories:
-                        product_categories[category] += cost
-                    else:
-                        product_categories[category] = cost
-                    
-                    # Ajouter aux préférences globales du client
-                    product_preferences[client_id][category] += cost
-            
-            purchase_info.append({
-                'client_id': client_id,
-                'age': age,
-                'sexe': sexe,
-                'total_achat': total_achat,
-                'nombre_produits': nombre_produits,
-                'product_categories': product_categories
-            })
-        
-        purchases_df = pd.DataFrame(purchase_info)
+        # Données de fidélité, totaux d'achats et dépenses par catégorie (colonnes cat_*)
+        combined_df = feature_store.select_features(table, 'loyalty', 'total_achat', 'nombre_produits', 'categories')
         
-        # Agréger les achats par client
-        if not purchases_df.empty and 'client_id' in purchases_df.columns:
-            purchases_agg = purchases_df.groupby('client_id').agg({
-                'total_achat': 'sum',
-                'nombre_produits': 'sum'
-            }).reset_index()
-            
-            # Merger avec les données de fidélité
-            combined_df = pd.merge(loyalty_df, purchases_agg, on='client_id', how='left')
-        else:
-            combined_df = loyalty_df.copy()
+        # Matrice clients x catégories des dépenses, alignée sur les lignes de combined_df
+        spend_matrix, product_categories_list = ingestion.client_category_matrix(
+            combined_df['client_id'], category_spend)
         
-        # Convertir les préférences produits en dataframe
-        product_categories_list = set()
-        for prefs in product_preferences.values():
-            product_categories_list.update(prefs.keys())
-        
-        # Créer des colonnes pour chaque catégorie de produit
-        for category in product_categories_list:
-            category_col = f"cat_{category.lower().replace(' ', '_').replace('/', '_')}"
-            combined_df[category_col] = combined_df['client_id'].map(
-                lambda x: product_preferences[x][category] if x in product_preferences else 0
-            )
-        
-        # Ajouter une colonne avec la catégorie préférée de chaque client
-        combined_df['categorie_preferee'] = combined_df['client_id'].map(
-            lambda x: max(product_preferences[x].items(), key=lambda item: item[1])[0] 
-            if x in product_preferences and product_preferences[x] else 'Inconnue'
-        )
-        
-        return combined_df, dict(product_preferences), list(product_categories_list)
+        return combined_df, dict(product_preferences), product_categories_list, spend_matrix
     
     except Exception as e:
         print(f"Error loading data: {str(e)}", file=sys.stderr)
         sys.exit(1)
 
-def prepare_data(df, features):
-    """Prepare data for clustering by selecting and scaling features."""
+def prepare_data(df, features, category_matrix=None, category_features=(), dtype=np.float64):
+    """Prepare data for clustering by selecting and scaling features.
+    
+    When category_matrix is given, the client x category spend matrix (rows
+    aligned with df) is appended to the selected features as is. The scaled
+    matrix is returned as `dtype` (float32 in compact mode).
+    """
     try:
         # Select relevant features
         X = df[features].copy()
         
         # Handle missing values
         X.fillna(0, inplace=True)
+        columns = X.columns.tolist()
+        
+        X = X.to_numpy(dtype=dtype)
+        if category_matrix is not None:
+            X = np.hstack([X, category_matrix.toarray().astype(dtype, copy=False)])
+            columns += list(category_features)
         
         # Scale the data
         scaler = StandardScaler()
         X_scaled = scaler.fit_transform(X)
         
-        return X_scaled, X.columns.tolist()
+        return X_scaled, columns
     
     except Exception as e:
         print(f"Error preparing data: {str(e)}", file=sys.stderr)
         sys.exit(1)
 
-def perform_clustering(X, n_clusters=3):
-    """Perform K-means clustering on the prepared data."""
+def perform_clustering(X, n_clusters=3, engine='kmeans', batch_size=segmentation.DEFAULT_BATCH_SIZE, pca_solver='auto'):
+    """Perform K-means clustering on the prepared data with an engine of segmentation.CLUSTERING_ENGINES.
+    
+    The 2-D projection uses a solver of segmentation.PCA_SOLVERS.
+    """
     try:
-        # Apply K-means clustering
-        kmeans = KMeans(n_clusters=n_clusters, random_state=42, n_init=10)
-        clusters = kmeans.fit_predict(X)
-        
-        # Calculate cluster centers
-        cluster_centers = kmeans.cluster_centers_
-        
-        # Calculate inertia (sum of squared distances to closest centroid)
-        inertia = kmeans.inertia_
+        # Apply K-means clustering, cluster centers and inertia (sum of squared distances to closest centroid)
+        clusters, cluster_centers, inertia = segmentation.fit_clusters(X, n_clusters, engine, batch_size)
         
         # If data has more than 2 dimensions, use PCA for visualization
         if X.shape[1] > 2:
-            pca = PCA(n_components=2)
-            X_pca = pca.fit_transform(X)
+            X_pca, pca = segmentation.fit_projection(X, 2, pca_solver, batch_size)
             pca_centers = pca.transform(cluster_centers)
             
             # Calculate variance explained by first 2 components
@@ -221,31 +171,62 @@ def recommend_loyalty_programs(client_preferences, product_categories):
     
     return recommendations
 
-def analyze_clusters(df, clusters, features, client_preferences, product_categories):
-    """Analyze clusters to derive insights about each customer segment."""
+def analyze_clusters(df, clusters, features, client_preferences, product_categories, spend_matrix, n_clusters=None):
+    """Analyze clusters to derive insights about each customer segment.
+    
+    Feature means and medians come from a single grouped aggregation, the
+    gender split from one crosstab and the spend of each segment by category
+    from the product of the cluster indicator matrix with spend_matrix (the
+    client x category matrix aligned with df, columns in product_categories
+    order). n_clusters (the number of centers, by default the highest label
+    + 1) includes empty clusters, which only get their size.
+    """
     try:
         # Add cluster labels to the dataframe
         df_with_clusters = df.copy()
         df_with_clusters['cluster'] = clusters
+        cluster_ids = range(n_clusters or int(clusters.max()) + 1)
+        sizes = np.bincount(clusters, minlength=len(cluster_ids))
+        
+        # Moyennes et médianes de toutes les variables en une agrégation groupée
+        stat_features = [feature for feature in features if feature in df.columns]
+        grouped = df_with_clusters.groupby('cluster')[stat_features].agg(['mean', 'median']) \
+            if stat_features else None
+        
+        # Répartition par sexe de chaque cluster
+        gender_counts = pd.crosstab(df_with_clusters['cluster'], df_with_clusters['sexe'].astype(object)) \
+            if 'sexe' in df.columns else None
+        
+        # Dépenses par segment et catégorie : indicatrice cluster x clients multipliée par la matrice des dépenses
+        indicator = sparse.csr_matrix((np.ones(len(clusters)), (clusters, np.arange(len(clusters)))),
+                                      shape=(len(cluster_ids), len(clusters)))
+        segment_spending = np.asarray((indicator @ spend_matrix).todense())
+        presence = spend_matrix.copy()
+        presence.data[:] = 1
+        segment_presence = np.asarray((indicator @ presence).todense()) > 0
         
         # Calculate statistics for each cluster
         cluster_stats = []
         
-        for cluster_id in range(len(np.unique(clusters))):
-            cluster_data = df_with_clusters[df_with_clusters['cluster'] == cluster_id]
+        for cluster_id in cluster_ids:
+            size = int(sizes[cluster_id])
             
             # Basic statistics
             stats = {
                 'cluster_id': cluster_id,
-                'size': len(cluster_data),
-                'percentage': round((len(cluster_data) / len(df)) * 100, 2)
+                'size': size,
+                'percentage': round((size / len(df)) * 100, 2)
             }
             
+            # Cluster vide (possible avec le moteur minibatch) : pas de statistiques
+            if size == 0:
+                cluster_stats.append(stats)
+                continue
+            
             # Add statistics for each feature
-            for feature in features:
-                if feature in df.columns:
-                    stats[f'{feature}_mean'] = round(cluster_data[feature].mean(), 2)
-                    stats[f'{feature}_median'] = round(cluster_data[feature].median(), 2)
+            for feature in stat_features:
+                stats[f'{feature}_mean'] = round(float(grouped.at[cluster_id, (feature, 'mean')]), 2)
+                stats[f'{feature}_median'] = round(float(grouped.at[cluster_id, (feature, 'median')]), 2)
                     
             # Add qualitative description based on the statistics
             if 'age' in features and 'age_mean' in stats:
@@ -273,11 +254,11 @@ def analyze_clusters(df, clusters, features, client_preferences, product_categor
                     stats['purchase_frequency'] = 'Fréquent'
             
             # Gender distribution
-            if 'sexe' in df.columns:
-                gender_counts = cluster_data['sexe'].value_counts()
-                if 'Homme' in gender_counts and 'Femme' in gender_counts:
-                    stats['homme_percentage'] = round((gender_counts['Homme'] / len(cluster_data)) * 100, 2)
-                    stats['femme_percentage'] = round((gender_counts['Femme'] / len(cluster_data)) * 100, 2)
+            if gender_counts is not None:
+                counts = gender_counts.loc[cluster_id] if cluster_id in gender_counts.index else pd.Series(dtype=int)
+                if counts.get('Homme', 0) > 0 and counts.get('Femme', 0) > 0:
+                    stats['homme_percentage'] = round((counts['Homme'] / size) * 100, 2)
+                    stats['femme_percentage'] = round((counts['Femme'] / size) * 100, 2)
                     stats['dominant_gender'] = 'Homme' if stats['homme_percentage'] > stats['femme_percentage'] else 'Femme'
             
             # Determine customer type based on combination of features
@@ -294,20 +275,14 @@ def analyze_clusters(df, clusters, features, client_preferences, product_categor
                 else:
                     stats['customer_type'] = 'Client Mixte'
             
-            # Analyse des préférences de produits pour ce segment
-            cluster_client_ids = cluster_data['client_id'].tolist()
-            
-            # Agréger les préférences de produits pour ce segment
-            segment_preferences = defaultdict(float)
-            for client_id in cluster_client_ids:
-                if client_id in client_preferences:
-                    for category, amount in client_preferences[client_id].items():
-                        segment_preferences[category] += amount
-            
-            # Trouver les catégories dominantes pour ce segment
-            if segment_preferences:
-                total_spending = sum(segment_preferences.values())
-                top_categories = sorted(segment_preferences.items(), key=lambda x: x[1], reverse=True)[:3]
+            # Catégories dominantes du segment (parmi celles achetées par ses clients)
+            present = np.flatnonzero(segment_presence[cluster_id])
+            if len(present):
+                amounts = segment_spending[cluster_id, present]
+                total_spending = float(amounts.sum())
+                top = present[np.argsort(-amounts, kind='stable')[:3]]
+                top_categories = [(product_categories[column], float(segment_spending[cluster_id, column]))
+                                  for column in top]
                 
                 stats['product_preferences'] = [
                     {
@@ -335,26 +310,26 @@ def analyze_clusters(df, clusters, features, client_preferences, product_categor
             
             cluster_stats.append(stats)
         
-        # Get sample clients from each cluster (max 10 per cluster)
+        # Get sample clients from each cluster (max 10 per cluster): first rows of each cluster after a shuffle
+        sampled = df_with_clusters.sample(frac=1).groupby('cluster', sort=False).head(10)
+        sampled = sampled.sort_values('cluster', kind='stable')
+        samples = ingestion.decode_json_columns(sampled.to_dict(orient='records'), df.attrs.get('json_columns', []))
         sample_clients = []
-        for cluster_id in range(len(np.unique(clusters))):
-            cluster_data = df_with_clusters[df_with_clusters['cluster'] == cluster_id]
-            samples = cluster_data.sample(min(10, len(cluster_data))).to_dict(orient='records')
-            for sample in samples:
-                sample['cluster'] = cluster_id
-                
-                # Ajouter les recommandations personnalisées
-                client_id = sample.get('client_id')
-                if client_id in client_preferences:
-                    preferences = client_preferences[client_id]
-                    if preferences:
-                        top_category = max(preferences.items(), key=lambda x: x[1])[0]
-                        if top_category in PRODUCT_LOYALTY_MAPPING:
-                            sample['recommended_programs'] = PRODUCT_LOYALTY_MAPPING[top_category]['recommended_programs']
-                            sample['category_explanation'] = PRODUCT_LOYALTY_MAPPING[top_category]['explanation']
-                            sample['preferred_category'] = top_category
-                
-                sample_clients.append(sample)
+        for sample in samples:
+            sample['cluster'] = int(sample['cluster'])
+            
+            # Ajouter les recommandations personnalisées
+            client_id = sample.get('client_id')
+            if client_id in client_preferences:
+                preferences = client_preferences[client_id]
+                if preferences:
+                    top_category = max(preferences.items(), key=lambda x: x[1])[0]
+                    if top_category in PRODUCT_LOYALTY_MAPPING:
+                        sample['recommended_programs'] = PRODUCT_LOYALTY_MAPPING[top_category]['recommended_programs']
+                        sample['category_explanation'] = PRODUCT_LOYALTY_MAPPING[top_category]['explanation']
+                        sample['preferred_category'] = top_category
+            
+            sample_clients.append(sample)
         
         return cluster_stats, sample_clients
     
@@ -362,13 +337,96 @@ def analyze_clusters(df, clusters, features, client_preferences, product_categor
         print(f"Error analyzing clusters: {str(e)}", file=sys.stderr)
         sys.exit(1)
 
+def stratified_sample(labels, max_points, seed=42):
+    """Row positions of a random sample of at most max_points rows, each cluster keeping its share.
+
+    Every non-empty cluster keeps at least one row while the budget allows
+    it, otherwise only the largest clusters do. Positions are returned sorted.
+    """
+    n = len(labels)
+    if n <= max_points:
+        return np.arange(n)
+    sizes = np.bincount(labels)
+    non_empty = np.flatnonzero(sizes)
+    quotas = np.zeros(len(sizes), dtype=np.int64)
+    if max_points >= len(non_empty):
+        # Une ligne par cluster, puis le reste du budget au prorata des lignes restantes
+        quotas[non_empty] = 1 + ((sizes[non_empty] - 1) * (max_points - len(non_empty))) // (n - len(non_empty))
+    else:
+        quotas[non_empty[np.argsort(-sizes[non_empty], kind='stable')[:max_points]]] = 1
+    
+    # Mélange, tri stable par cluster puis rang dans le cluster
+    shuffled = np.random.default_rng(seed).permutation(n)
+    order = shuffled[np.argsort(labels[shuffled], kind='stable')]
+    sorted_labels = labels[order]
+    rank = np.arange(n) - np.searchsorted(sorted_labels, sorted_labels, side='left')
+    return np.sort(order[rank < quotas[sorted_labels]])
+
+def density_grids(points, labels, n_clusters, bins=GRID_BINS):
+    """Count the 2-D points of each cluster on a shared bins x bins grid.
+
+    Returns the grid edges and, for each cluster, its non-empty cells as [x_bin, y_bin, count].
+    """
+    x_edges = np.linspace(points[:, 0].min(), points[:, 0].max(), bins + 1)
+    y_edges = np.linspace(points[:, 1].min(), points[:, 1].max(), bins + 1)
+    x_bins = np.clip(np.searchsorted(x_edges, points[:, 0], side='right') - 1, 0, bins - 1)
+    y_bins = np.clip(np.searchsorted(y_edges, points[:, 1], side='right') - 1, 0, bins - 1)
+    counts = np.bincount((labels * bins + x_bins) * bins + y_bins,
+                         minlength=n_clusters * bins * bins).reshape(n_clusters, bins, bins)
+    
+    clusters = []
+    for cluster_id in range(n_clusters):
+        cells = np.argwhere(counts[cluster_id] > 0)
+        clusters.append({
+            'cluster': cluster_id,
+            'cells': np.column_stack([cells, counts[cluster_id][cells[:, 0], cells[:, 1]]]).tolist()
+        })
+    return {'bins': bins, 'x_edges': x_edges.tolist(), 'y_edges': y_edges.tolist(), 'clusters': clusters}
+
+def visualization_data(X_pca, pca_centers, clusters, explained_variance, lod='full',
+                       max_points=DEFAULT_MAX_POINTS, grid_bins=GRID_BINS):
+    """Build the visualization payload at a level of detail of LOD_MODES.
+
+    'full' returns every point, 'sample' a stratified sample of at most
+    max_points points (see stratified_sample) and 'grid' no point but the
+    per-cluster density grids (see density_grids).
+    """
+    data = {
+        'lod': lod,
+        'total_points': int(len(clusters)),
+        'centers': np.asarray(pca_centers).tolist(),
+        'explained_variance': np.asarray(explained_variance).tolist()
+    }
+    if lod == 'grid':
+        data['points'] = []
+        data['cluster_labels'] = []
+        data['density'] = density_grids(np.asarray(X_pca), clusters, len(pca_centers), grid_bins)
+    else:
+        rows = stratified_sample(clusters, max_points) if lod == 'sample' else slice(None)
+        data['points'] = np.asarray(X_pca)[rows].tolist()
+        data['cluster_labels'] = clusters[rows].tolist()
+    return data
+
 def main():
     parser = argparse.ArgumentParser(description='Customer Clustering Analysis')
-    parser.add_argument('--loyalty', required=True, help='Path to the loyalty points JSON file')
-    parser.add_argument('--purchases', required=True, help='Path to the purchases JSON file')
+    parser.add_argument('--loyalty', required=True, help='Path to the loyalty points JSON or JSON Lines file')
+    parser.add_argument('--purchases', required=True, help='Path to the purchases JSON or JSON Lines file, or a directory / glob pattern of daily exports')
     parser.add_argument('--clusters', type=int, default=3, help='Number of clusters to create')
     parser.add_argument('--features', default='age,points_cumules,nombre_achats', 
                       help='Comma-separated list of features to use for clustering')
+    segmentation.add_clustering_arguments(parser)
+    parser.add_argument('--sweep', nargs='?', const=segmentation.DEFAULT_SWEEP, type=segmentation.parse_k_range, default=None,
+                        help=f'Fit every number of clusters of a range MIN-MAX (default {segmentation.DEFAULT_SWEEP}) in parallel (--workers), '
+                             'return the inertia / silhouette curve and cluster with the recommended one')
+    parser.add_argument('--pca-solver', choices=segmentation.PCA_SOLVERS, default='auto',
+                        help='PCA of the 2-D visualization: auto (solver chosen by scikit-learn for the matrix shape), exact (full SVD), randomized (randomized SVD) or incremental (chunks of --batch-size rows)')
+    parser.add_argument('--lod', choices=LOD_MODES, default='full',
+                        help='Level of detail of visualization_data: every point, a stratified sample per cluster (--max-points) or per-cluster density grids')
+    parser.add_argument('--max-points', type=int, default=DEFAULT_MAX_POINTS,
+                        help='Point budget of the sample level of detail (hard cap)')
+    parser.add_argument('--grid-bins', type=int, default=GRID_BINS,
+                        help='Bins per axis of the grid level of detail')
+    ingestion.add_ingestion_arguments(parser)
     
     args = parser.parse_args()
     
@@ -376,7 +434,8 @@ def main():
     feature_list = args.features.split(',')
     
     # Load and prepare data
-    df, client_preferences, product_categories = load_data(args.loyalty, args.purchases)
+    df, client_preferences, product_categories, spend_matrix = load_data(
+        args.loyalty, args.purchases, **ingestion.ingestion_options(args))
     
     # Ensure all requested features exist in the dataframe
     valid_features = [f for f in feature_list if f in df.columns]
@@ -385,22 +444,34 @@ def main():
         sys.exit(1)
     
     # Add product category features if requested
+    category_features = []
     if 'product_categories' in feature_list:
-        # Select product category columns that start with 'cat_'
-        cat_features = [col for col in df.columns if col.startswith('cat_')]
-        valid_features.extend(cat_features)
+        # Product category columns, in the column order of the spend matrix
+        category_features = [feature_store.category_column(category) for category in product_categories]
     
     # Prepare data for clustering
-    X_scaled, final_features = prepare_data(df, valid_features)
+    X_scaled, final_features = prepare_data(
+        df, valid_features, spend_matrix if category_features else None, category_features,
+        dtype=np.float32 if args.compact else np.float64)
+    valid_features.extend(category_features)
+    
+    # Balayage de k : courbe inertie / silhouette, puis partitionnement avec le k recommandé
+    k_sweep = None
+    if args.sweep:
+        k_sweep = segmentation.sweep_clusters(X_scaled, args.sweep, args.engine, args.batch_size, workers=args.workers)
+        if k_sweep['recommended_k']:
+            args.clusters = k_sweep['recommended_k']
     
     # Perform clustering
-    clusters, centers, X_pca, pca_centers, inertia, explained_variance = perform_clustering(X_scaled, args.clusters)
+    clusters, centers, X_pca, pca_centers, inertia, explained_variance = perform_clustering(
+        X_scaled, args.clusters, args.engine, args.batch_size, args.pca_solver)
     
     # Generate product-based loyalty recommendations
     loyalty_recommendations = recommend_loyalty_programs(client_preferences, product_categories)
     
     # Analyze clusters
-    cluster_stats, sample_clients = analyze_clusters(df, clusters, valid_features, client_preferences, product_categories)
+    cluster_stats, sample_clients = analyze_clusters(
+        df, clusters, valid_features, client_preferences, product_categories, spend_matrix, len(centers))
     
     # Prepare results
     results = {
@@ -408,15 +479,22 @@ def main():
         'sample_clients': sample_clients,
         'features_used': final_features,
         'num_clusters': args.clusters,
-        'visualization_data': {
-            'points': X_pca.tolist(),
-            'centers': pca_centers.tolist(),
-            'cluster_labels': clusters.tolist(),
-            'explained_variance': explained_variance.tolist()
-        },
+        'engine': args.engine,
+        'inertia': round(float(inertia), 2),
+        'visualization_data': visualization_data(X_pca, pca_centers, clusters, explained_variance,
+                                                 args.lod, args.max_points, args.grid_bins),
         'product_categories': product_categories,
         'loyalty_recommendations': loyalty_recommendations
     }
+    if args.lod != 'full':
+        # Réponse bornée : recommandations des seuls clients d'exemple
+        results['loyalty_recommendations'] = {
+            sample['client_id']: loyalty_recommendations[sample['client_id']]
+            for sample in sample_clients if sample.get('client_id') in loyalty_recommendations}
+        results['loyalty_recommendations_total'] = len(loyalty_recommendations)
+    
+    if k_sweep:
+        results['k_sweep'] = k_sweep
     
     # Output results as JSON
     print(json.dumps(results))
@@ -0,0 +1,257 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Per-customer feature store shared by the analysis scripts.
+
+The full feature table (purchase totals, ratios, category spend and
+time-series features) is computed once per data version and persisted in
+the ingestion cache; each script then selects the columns it needs.
+Features that depend on the reference date (jours_depuis_*) are derived
+when the table is read.
+"""
+
+import os
+import hashlib
+from datetime import datetime, date
+import numpy as np
+import pandas as pd
+import ingestion
+
+# Bump when a stored feature is added, removed or computed differently
+FEATURE_SCHEMA_VERSION = 1
+
+TIME_SERIES_FEATURES = ['rolling_avg', 'trend', 'seasonality', 'volatility', 'max_purchase',
+                        'last_purchase', 'purchase_count', 'total_spent', 'avg_purchase']
+
+FEATURE_GROUPS = {
+    'purchases': ['total_achat', 'nombre_produits', 'date_achat'],
+    'ratios': ['points_par_achat', 'panier_moyen'],
+    'time_series': [f'ts_{feature}' for feature in TIME_SERIES_FEATURES]
+}
+
+# Features derived from the reference date by add_recency_features
+RECENCY_FEATURES = ['jours_depuis_inscription', 'jours_depuis_dernier_achat', 'frequence_achat']
+
+CATEGORY_PREFIX = 'cat_'
+
+def category_column(category):
+    """Name of the spend column of a product category."""
+    return f"{CATEGORY_PREFIX}{category.lower().replace(' ', '_').replace('/', '_')}"
+
+def time_series_features(monthly):
+    """Compute the time-series features of each client from the monthly aggregates.
+
+    All clients are processed at once with grouped array operations over the
+    months sorted by client. Returns a DataFrame indexed by client_id with one
+    column per TIME_SERIES_FEATURES.
+    """
+    time_series = monthly.sort_values(['client_id', 'year_month'])
+    codes, client_ids = pd.factorize(time_series['client_id'])
+    y = time_series['total_achat'].to_numpy(dtype=float)
+    n_clients = len(client_ids)
+
+    # Taille de chaque série, position de chaque mois et rang depuis le dernier mois
+    counts = np.bincount(codes, minlength=n_clients)
+    ends = np.cumsum(counts)
+    position = np.arange(len(codes)) - (ends - counts)[codes]
+    from_last = counts[codes] - 1 - position
+
+    totals = np.bincount(codes, weights=y, minlength=n_clients)
+    means = totals / counts
+    grouped = pd.Series(y).groupby(codes)
+    has_series = counts >= 3  # Need at least 3 data points for meaningful time series
+
+    # 3-month moving average at the last month (mean of all months below 3)
+    recent = from_last < 3
+    rolling_avg = np.bincount(codes[recent], weights=y[recent], minlength=n_clients) / np.minimum(counts, 3)
+
+    # Trend: closed-form least-squares slope over the last 6 points (or all if less)
+    window = np.minimum(counts, 6)
+    in_window = from_last < window[codes]
+    x_centered = (window[codes] - 1 - from_last) - (window[codes] - 1) / 2
+    numerator = np.bincount(codes[in_window], weights=(x_centered * y)[in_window], minlength=n_clients)
+    denominator = window * (window ** 2 - 1) / 12
+    trend = np.where(has_series, numerator / np.where(has_series, denominator, 1), 0.0)
+
+    # Seasonality (at least a year of data): dispersion of the month-of-year averages
+    monthly_avg = pd.Series(y).groupby([codes, time_series['year_month'].dt.month.to_numpy()]).mean()
+    month_std = monthly_avg.groupby(level=0).std().reindex(range(n_clients)).to_numpy()
+    with np.errstate(divide='ignore', invalid='ignore'):
+        seasonality = np.where((counts >= 12) & (means > 0), month_std / means, 0.0)
+
+    return pd.DataFrame({
+        'rolling_avg': rolling_avg,
+        'trend': trend,
+        'seasonality': seasonality,
+        'volatility': np.where(has_series, grouped.std().to_numpy(), 0.0),
+        'max_purchase': grouped.max().to_numpy(),
+        'last_purchase': y[ends - 1],
+        'purchase_count': counts,
+        'total_spent': totals,
+        'avg_purchase': means
+    }, index=pd.Index(client_ids, name='client_id'), columns=TIME_SERIES_FEATURES)
+
+def build_feature_table(loyalty_df, aggregates):
+    """Build the per-customer feature table, one row per loyalty record."""
+    # Totaux d'achats par client
+    table = pd.merge(loyalty_df, aggregates['client_totals'][['client_id'] + FEATURE_GROUPS['purchases']],
+                     on='client_id', how='left')
+
+    # Ratios de fidélité
+    if 'points_cumules' in table.columns and 'nombre_achats' in table.columns:
+        purchases = table['nombre_achats'].replace(0, 1)
+        table['points_par_achat'] = table['points_cumules'] / purchases
+        table['panier_moyen'] = table['total_achat'] / purchases
+
+    # Dépenses par catégorie et catégorie préférée
+    spend_matrix, categories = ingestion.client_category_matrix(table['client_id'], aggregates['category_spend'])
+    category_df = pd.DataFrame(spend_matrix.toarray(), columns=[category_column(c) for c in categories],
+                               index=table.index)
+    if spend_matrix.shape[1] == 0:
+        # Aucune catégorie (export sans Produits ou vide) : argmax impossible
+        category_df['categorie_preferee'] = 'Inconnue'
+    else:
+        has_preferences = np.diff(spend_matrix.indptr) > 0
+        preferred = np.asarray(spend_matrix.argmax(axis=1)).ravel()
+        category_df['categorie_preferee'] = np.where(
+            has_preferences, np.asarray(categories + ['Inconnue'], dtype=object)[preferred], 'Inconnue')
+
+    # Séries temporelles mensuelles (0 pour les clients sans achat)
+    ts_df = time_series_features(aggregates['monthly']).reindex(
+        table['client_id'].to_numpy(), fill_value=0)
+    ts_df.columns = FEATURE_GROUPS['time_series']
+    ts_df.index = table.index
+
+    json_columns = loyalty_df.attrs.get('json_columns', [])
+    table = pd.concat([table, category_df, ts_df], axis=1)
+    table.attrs['json_columns'] = json_columns
+    return table
+
+def load_feature_table(loyalty_path, purchases_path, cache_dir=ingestion.DEFAULT_CACHE_DIR,
+                       compact=False, **ingest_options):
+    """Return (feature table, aggregates), reusing the persisted table of this data version.
+
+    ingest_options are passed to ingestion.load_aggregates. The table is
+    cached at full width; compact mode is applied after loading.
+    """
+    loyalty_df, aggregates = ingestion.load_aggregates(loyalty_path, purchases_path,
+                                                       cache_dir=cache_dir, **ingest_options)
+
+    table = None
+    cache_path = None
+    if cache_dir:
+        data_version = ingestion.data_version(loyalty_path, purchases_path, cache_dir,
+                                              ingest_options.get('incremental', False))
+        version = f"v{FEATURE_SCHEMA_VERSION}-{data_version}"
+        # One entry per pair of inputs, keyed on the loyalty file
+        location = hashlib.blake2b(os.path.abspath(purchases_path).encode('utf-8'), digest_size=4).hexdigest()
+        cache_path = ingestion.cache_entry_path(cache_dir, loyalty_path, f'features-{location}', version)
+        cached = ingestion.read_cache(cache_path, ['features'])
+        if cached is not None:
+            table = cached[0]
+
+    if table is None:
+        table = build_feature_table(loyalty_df, aggregates)
+        if cache_path:
+            ingestion.write_cache(cache_path, {'features': table})
+
+    if compact:
+        return ingestion.compact_tables(table, aggregates)
+    return table, aggregates
+
+def select_features(table, *names):
+    """Select feature columns by group name (see FEATURE_GROUPS) or column name.
+
+    'loyalty' selects the columns of the loyalty file and 'categories' the
+    category spend columns plus categorie_preferee. Missing columns are skipped.
+    """
+    stored = set(sum(FEATURE_GROUPS.values(), ['categorie_preferee']))
+    columns = []
+    for name in names:
+        if name == 'loyalty':
+            columns += [c for c in table.columns if c not in stored and not c.startswith(CATEGORY_PREFIX)]
+        elif name == 'categories':
+            columns += [c for c in table.columns if c.startswith(CATEGORY_PREFIX)] + ['categorie_preferee']
+        else:
+            columns += FEATURE_GROUPS.get(name, [name])
+    columns = [c for c in dict.fromkeys(columns) if c in table.columns]
+
+    selected = table[columns].copy()
+    selected.attrs['json_columns'] = [c for c in table.attrs.get('json_columns', []) if c in columns]
+    return selected
+
+def reference_date(as_of=None):
+    """Return the reference date of recency features: as_of, or today at midnight."""
+    return as_of or datetime.combine(date.today(), datetime.min.time())
+
+def parse_as_of(value):
+    """argparse type of the --as-of option (YYYY-MM-DD)."""
+    return datetime.strptime(value, '%Y-%m-%d')
+
+def add_recency_features(df, as_of=None):
+    """Derive the features that depend on the reference date (see reference_date)."""
+    as_of = reference_date(as_of)
+    for column in ['dernier_achat', 'date_inscription']:
+        if column in df.columns:
+            df[column] = pd.to_datetime(df[column], errors='coerce')
+
+    if 'dernier_achat' in df.columns and 'date_inscription' in df.columns:
+        df['jours_depuis_inscription'] = (as_of - df['date_inscription']).dt.days
+        df['jours_depuis_dernier_achat'] = (as_of - df['dernier_achat']).dt.days
+        df['frequence_achat'] = df['jours_depuis_inscription'] / df['nombre_achats']
+    return df
+
+def _rank_within(keys):
+    """Rank of each element among the equal consecutive keys of a sorted array."""
+    return np.arange(len(keys)) - np.searchsorted(keys, keys, side='left')
+
+def preference_index(client_ids, category_spend, product_spend, top_categories=3, top_products=2):
+    """Index the favourite categories and products of each client in CSR layout.
+
+    Categories of a client, and products of a client's category, are ranked
+    by (count, amount) descending, ties keeping their order of first
+    appearance, and cut to top_categories / top_products. Row r of
+    category_indptr describes the client of row rows[i] == r, so that
+    duplicated client_ids share one row (-1 for clients without purchases).
+    Category entry e points to products product_start[e]:product_end[e].
+    """
+    clients = pd.Index(pd.unique(np.asarray(client_ids, dtype=object)))
+    category_codes, categories = pd.factorize(category_spend['categorie'])
+    n_categories = max(len(categories), 1)
+
+    # Catégories : tri par client puis (count, amount) décroissants, rang dans chaque client
+    rows = clients.get_indexer(category_spend['client_id'])
+    counts = category_spend['count'].to_numpy()
+    amounts = category_spend['amount'].to_numpy()
+    order = np.lexsort((np.arange(len(rows)), -amounts, -counts, rows))
+    order = order[rows[order] >= 0]
+    order = order[_rank_within(rows[order]) < top_categories]
+    category_rows = rows[order]
+    category_indptr = np.zeros(len(clients) + 1, dtype=np.int64)
+    np.cumsum(np.bincount(category_rows, minlength=len(clients)), out=category_indptr[1:])
+
+    # Produits : tri par (client, catégorie) puis (count, amount) décroissants
+    product_codes, products = pd.factorize(product_spend['nom_produit'])
+    product_rows = clients.get_indexer(product_spend['client_id'])
+    groups = product_rows * n_categories + pd.Index(categories).get_indexer(product_spend['categorie'])
+    product_order = np.lexsort((np.arange(len(groups)), -product_spend['amount'].to_numpy(),
+                                -product_spend['count'].to_numpy(), groups))
+    product_order = product_order[product_rows[product_order] >= 0]
+    product_order = product_order[_rank_within(groups[product_order]) < top_products]
+    product_groups = groups[product_order]
+
+    # Plage des produits de chaque catégorie retenue
+    category_groups = category_rows * n_categories + category_codes[order]
+    return {
+        'rows': clients.get_indexer(client_ids),
+        'categories': np.asarray(categories, dtype=object),
+        'products': np.asarray(products, dtype=object),
+        'category_indptr': category_indptr,
+        'category_ids': category_codes[order],
+        'category_counts': counts[order],
+        'category_amounts': amounts[order],
+        'product_start': np.searchsorted(product_groups, category_groups, side='left'),
+        'product_end': np.searchsorted(product_groups, category_groups, side='right'),
+        'product_ids': product_codes[product_order],
+        'product_counts': product_spend['count'].to_numpy()[product_order],
+        'product_amounts': product_spend['amount'].to_numpy()[product_order]
+    }
@@ -0,0 +1,757 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Shared data ingestion for the analysis scripts.
+
+Parses the loyalty and purchases files (JSON arrays or JSON Lines) into flat
+pandas tables and keeps a binary columnar copy of the loyalty table and of the
+purchase aggregates in an on-disk cache, so repeat runs on unchanged files
+skip JSON parsing entirely.
+"""
+
+import os
+import io
+import glob
+import json
+import hashlib
+import functools
+import logging
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+logger = logging.getLogger('ingestion')
+
+# Bump when the layout of the cached tables changes
+CACHE_VERSION = 1
+
+DEFAULT_CACHE_DIR = os.environ.get(
+    'SCAN2FRONT_CACHE_DIR',
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data', '.cache')
+)
+
+PURCHASE_COLUMNS = ['client_id', 'age', 'sexe', 'date_achat', 'total_achat', 'nombre_produits']
+LINE_ITEM_COLUMNS = ['client_id', 'date_achat', 'categorie', 'nom_produit', 'cout']
+
+# Purchase records aggregated at once in streaming mode
+DEFAULT_CHUNK_SIZE = 50000
+
+# Newline-delimited JSON files are split into byte ranges of at least this
+# size, each parsed by its own worker process
+RANGE_MIN_BYTES = 4 << 20
+JSON_LINES_EXTENSIONS = ('.jsonl', '.ndjson')
+SHARD_EXTENSIONS = ('.json',) + JSON_LINES_EXTENSIONS
+
+# Aggregate table -> grouping keys. Every other column is summed when partial
+# aggregates are merged, except the last purchase date which keeps the max.
+AGGREGATE_KEYS = {
+    'client_totals': ['client_id'],
+    'monthly': ['client_id', 'year_month'],
+    'category_spend': ['client_id', 'categorie'],
+    'product_spend': ['client_id', 'categorie', 'nom_produit']
+}
+
+# Table column -> (JSON key, default value when the key is missing)
+PURCHASE_FIELDS = {
+    'client_id': ('Client_ID', None),
+    'age': ('Âge', 0),
+    'sexe': ('Sexe', ''),
+    'date_achat': ('Date_Achat', ''),
+    'total_achat': ('Total_Achat (€)', 0),
+    'nombre_produits': ('Nombre_Produits', 0)
+}
+PRODUCT_FIELDS = {
+    'categorie': ('Catégorie', 'Autre'),
+    'nom_produit': ('Nom_Produit', 'Inconnu'),
+    'cout': ('Total_Coût_Produit (€)', 0)
+}
+
+# Repeated string columns stored as categoricals in compact mode
+COMPACT_CATEGORICALS = ('client_id', 'nom', 'sexe', 'statut', 'categorie', 'nom_produit')
+INT32_RANGE = (np.iinfo(np.int32).min, np.iinfo(np.int32).max)
+
+def add_ingestion_arguments(parser):
+    """Register the ingestion options shared by all analysis scripts."""
+    parser.add_argument('--cache-dir', default=DEFAULT_CACHE_DIR,
+                        help='Directory holding the binary cache of parsed input files')
+    parser.add_argument('--no-cache', action='store_true',
+                        help='Always parse the JSON inputs and never touch the cache')
+    parser.add_argument('--stream', action='store_true',
+                        help='Stream the purchases file and aggregate it chunk by chunk with bounded memory')
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE,
+                        help='Number of purchase records aggregated per chunk in streaming mode')
+    parser.add_argument('--workers', type=int, default=0,
+                        help='Worker processes used to parse JSON Lines inputs and purchase shards (0 = one per CPU)')
+    parser.add_argument('--incremental', action='store_true',
+                        help='Only fold purchases added since the last run into the persisted aggregates')
+    parser.add_argument('--compact', action='store_true',
+                        help='Use categoricals, int32 counts and float32 amounts to reduce memory per customer')
+
+def ingestion_options(args):
+    """Translate parsed command line arguments into keyword arguments for load_aggregates."""
+    return {
+        'cache_dir': None if args.no_cache else args.cache_dir,
+        'stream': args.stream,
+        'chunk_size': args.chunk_size,
+        'workers': args.workers,
+        'incremental': args.incremental,
+        'compact': args.compact
+    }
+
+@functools.lru_cache(maxsize=None)
+def _content_digest(path, size, mtime_ns):
+    """Hash the content of path (memoized per size and mtime within a process)."""
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def file_fingerprint(path):
+    """Return a cache key built from the file size, mtime and content hash."""
+    stat = os.stat(path)
+    digest = _content_digest(os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+    return f"{stat.st_size}-{stat.st_mtime_ns}-{digest}"
+
+def data_version(loyalty_path, purchases_path, cache_dir=DEFAULT_CACHE_DIR, incremental=False):
+    """Return a key identifying the content of the loyalty file and of every purchases source.
+
+    Unlike file_fingerprint it ignores modification times, so touching or
+    copying an unchanged export keeps the same version. In incremental mode
+    the purchases are identified by the watermarks of the last
+    incremental_aggregates run (size, mtime, offset and tail digest of each
+    source) rather than by hashing the whole history again.
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    stat = os.stat(loyalty_path)
+    digest.update(_content_digest(os.path.abspath(loyalty_path), stat.st_size, stat.st_mtime_ns).encode('utf-8'))
+
+    watermarks = None
+    if incremental and cache_dir:
+        cached = read_cache(cache_entry_path(cache_dir, purchases_path, 'state', 'latest'), ['watermarks'])
+        watermarks = cached[0] if cached is not None and len(cached[0]) else None
+    if watermarks is not None:
+        for mark in watermarks.sort_values('path').to_dict(orient='records'):
+            digest.update(f"{mark['path']}|{mark['size']}|{mark['mtime_ns']}|{mark['offset']}|{mark['digest']}".encode('utf-8'))
+        return f"i{digest.hexdigest()}"
+
+    for path in resolve_purchase_sources(purchases_path):
+        stat = os.stat(path)
+        digest.update(_content_digest(os.path.abspath(path), stat.st_size, stat.st_mtime_ns).encode('utf-8'))
+    return digest.hexdigest()
+
+def _encode_frame(df):
+    """Convert a DataFrame into a dict of numpy arrays suitable for np.savez."""
+    arrays = {}
+    kinds = {}
+    for i, column in enumerate(df.columns):
+        values = df[column]
+        if pd.api.types.is_numeric_dtype(values) or pd.api.types.is_bool_dtype(values) \
+                or pd.api.types.is_datetime64_dtype(values):
+            arrays[f'c{i}'] = values.to_numpy()
+            kinds[column] = 'num'
+            continue
+        if isinstance(values.dtype, pd.PeriodDtype):
+            arrays[f'c{i}'] = values.array.asi8
+            kinds[column] = 'period'
+            continue
+
+        # Nested columns are already JSON text (see _nested_to_text), only the tag differs
+        kinds[column] = 'json' if column in df.attrs.get('json_columns', ()) else 'str'
+
+        # Dictionary encoding: integer codes plus the utf-8 bytes of each distinct value
+        codes, uniques = pd.factorize(values)
+        encoded = [str(u).encode('utf-8') for u in uniques]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum([len(b) for b in encoded], out=offsets[1:])
+        arrays[f'c{i}'] = codes.astype(np.int32)
+        arrays[f'c{i}_offsets'] = offsets
+        arrays[f'c{i}_data'] = np.frombuffer(b''.join(encoded), dtype=np.uint8)
+
+    meta = {'version': CACHE_VERSION, 'columns': list(df.columns), 'kinds': kinds}
+    arrays['meta'] = np.frombuffer(json.dumps(meta).encode('utf-8'), dtype=np.uint8)
+    return arrays
+
+def _decode_frame(npz):
+    """Rebuild a DataFrame from the arrays written by _encode_frame."""
+    meta = json.loads(npz['meta'].tobytes().decode('utf-8'))
+    if meta.get('version') != CACHE_VERSION:
+        raise ValueError('Stale cache layout')
+
+    data = {}
+    json_columns = []
+    for i, column in enumerate(meta['columns']):
+        if meta['kinds'][column] == 'num':
+            data[column] = npz[f'c{i}']
+            continue
+        if meta['kinds'][column] == 'period':
+            data[column] = pd.arrays.PeriodArray(npz[f'c{i}'], dtype=pd.PeriodDtype('M'))
+            continue
+
+        raw = npz[f'c{i}_data'].tobytes()
+        offsets = npz[f'c{i}_offsets']
+        uniques = np.empty(len(offsets), dtype=object)
+        uniques[:-1] = [raw[start:end].decode('utf-8') for start, end in zip(offsets[:-1], offsets[1:])]
+        uniques[-1] = None  # code -1 marks a missing value
+        data[column] = uniques[npz[f'c{i}']]
+        if meta['kinds'][column] == 'json':
+            json_columns.append(column)
+
+    df = pd.DataFrame(data, columns=meta['columns'])
+    df.attrs['json_columns'] = json_columns
+    return df
+
+def cache_entry_path(cache_dir, source_path, kind, fingerprint):
+    """Path of the cache entry of a source file for a kind of table and a fingerprint.
+
+    Writing an entry (see write_cache) removes the entries of older
+    fingerprints of the same source and kind.
+    """
+    # Shards from different directories often share a file name
+    source_path = os.path.abspath(source_path)
+    location = hashlib.blake2b(source_path.encode('utf-8'), digest_size=4).hexdigest()
+    return os.path.join(cache_dir, f"{os.path.basename(source_path)}-{location}.{kind}.{fingerprint}.npz")
+
+def read_cache(path, kinds):
+    """Return the cached tables stored in path, or None if unavailable."""
+    if not os.path.exists(path):
+        return None
+    try:
+        with np.load(path, allow_pickle=False) as npz:
+            frames = []
+            for kind in kinds:
+                prefix = f'{kind}/'
+                frames.append(_decode_frame({k[len(prefix):]: npz[k] for k in npz.files if k.startswith(prefix)}))
+        return frames
+    except Exception as e:
+        logger.warning(f"Ignoring unreadable cache file {path}: {str(e)}")
+        return None
+
+def write_cache(path, tables):
+    """Atomically write the given {kind: DataFrame} tables to path."""
+    try:
+        cache_dir = os.path.dirname(path)
+        os.makedirs(cache_dir, exist_ok=True)
+        arrays = {}
+        for kind, df in tables.items():
+            arrays.update({f'{kind}/{k}': v for k, v in _encode_frame(df).items()})
+
+        buffer = io.BytesIO()
+        np.savez(buffer, **arrays)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(buffer.getvalue())
+        os.replace(tmp_path, path)
+
+        # Drop the entries cached for older versions of the same source file
+        prefix = os.path.basename(path).rsplit('.', 2)[0] + '.'
+        for entry in os.listdir(cache_dir):
+            fingerprint = entry[len(prefix):-len('.npz')]
+            if entry.startswith(prefix) and entry.endswith('.npz') and '.' not in fingerprint \
+                    and entry != os.path.basename(path):
+                os.remove(os.path.join(cache_dir, entry))
+    except OSError as e:
+        logger.warning(f"Could not write cache file {path}: {str(e)}")
+
+def save_table(path, df):
+    """Write one DataFrame to a columnar .npz file (nested list/dict columns as JSON text)."""
+    df = _nested_to_text(df.copy())
+    buffer = io.BytesIO()
+    np.savez(buffer, **_encode_frame(df))
+    with open(path, 'wb') as f:
+        f.write(buffer.getvalue())
+
+def _nested_to_text(df):
+    """Store nested list/dict columns as JSON text, as done for cached tables."""
+    json_columns = []
+    for column in df.columns:
+        if not pd.api.types.is_numeric_dtype(df[column]) and df[column].map(lambda v: isinstance(v, (list, dict))).any():
+            df[column] = df[column].map(lambda v: None if v is None else json.dumps(v, ensure_ascii=False))
+            json_columns.append(column)
+    df.attrs['json_columns'] = json_columns
+    return df
+
+def decode_json_columns(records, json_columns):
+    """Turn the JSON text of nested columns back into lists/dicts in output records."""
+    for record in records:
+        for column in json_columns:
+            if isinstance(record.get(column), str):
+                record[column] = json.loads(record[column])
+    return records
+
+def _field(raw, source, default, length):
+    """Return the raw column `source`, filling missing keys with `default`."""
+    if source not in raw.columns:
+        return pd.Series([default] * length, index=raw.index)
+    column = raw[source]
+    return column if default is None else column.fillna(default)
+
+def flatten_purchases(purchases_data):
+    """Flatten purchase records into a purchases table and a line-item table.
+
+    The nested ``Produits`` arrays are exploded into one long line-item table
+    in a single vectorized pass rather than walked product by product.
+    """
+    raw = pd.DataFrame.from_records(purchases_data) if len(purchases_data) else pd.DataFrame()
+    purchases_df = pd.DataFrame({
+        column: _field(raw, source, default, len(raw)) for column, (source, default) in PURCHASE_FIELDS.items()
+    }, columns=PURCHASE_COLUMNS)
+
+    if 'Produits' not in raw.columns or raw.empty:
+        return purchases_df, pd.DataFrame({column: pd.Series(dtype=float if column == 'cout' else object)
+                                           for column in LINE_ITEM_COLUMNS})
+
+    # Une ligne par produit acheté, uniquement pour les achats rattachés à un client
+    has_client = purchases_df['client_id'].notna() & (purchases_df['client_id'] != '')
+    exploded = pd.DataFrame({
+        'client_id': purchases_df['client_id'],
+        'date_achat': purchases_df['date_achat'],
+        'product': raw['Produits']
+    })[has_client].explode('product', ignore_index=True)
+    exploded = exploded[exploded['product'].map(lambda p: isinstance(p, dict))]
+
+    products = pd.DataFrame.from_records(exploded['product'].tolist(), index=exploded.index)
+    items_df = pd.DataFrame({
+        'client_id': exploded['client_id'],
+        'date_achat': exploded['date_achat']
+    })
+    for column, (source, default) in PRODUCT_FIELDS.items():
+        items_df[column] = _field(products, source, default, len(products))
+    items_df['cout'] = items_df['cout'].astype(float)
+    return purchases_df, items_df.reset_index(drop=True)
+
+def spend_by(items_df, keys):
+    """Count line items and sum their cost per group of `keys`.
+
+    Groups keep the order in which they first appear in the line items.
+    """
+    return items_df.groupby(keys, sort=False)['cout'].agg(count='size', amount='sum').reset_index()
+
+def client_category_matrix(client_ids, category_spend, value='amount'):
+    """Build the sparse client x category matrix of `value` from a category_spend table.
+
+    Rows follow client_ids (clients without purchases get an empty row) and
+    columns follow the returned list of categories.
+    """
+    clients = pd.Index(pd.unique(np.asarray(client_ids, dtype=object)))
+    rows = clients.get_indexer(category_spend['client_id'])
+    columns, categories = pd.factorize(category_spend['categorie'])
+    known = rows >= 0
+    matrix = sparse.csr_matrix(
+        (category_spend[value].to_numpy()[known], (rows[known], columns[known])),
+        shape=(len(clients), len(categories))
+    )
+    # Repeat rows for duplicated client ids
+    return matrix[clients.get_indexer(client_ids)], list(categories)
+
+def aggregate_purchases(purchases_df, items_df):
+    """Pre-aggregate purchases and line items into the per-client tables of AGGREGATE_KEYS.
+
+    The result is bounded by the number of clients, months, categories and
+    products rather than by the number of purchase records.
+    """
+    dates = pd.to_datetime(purchases_df['date_achat'], errors='coerce')
+    purchases = purchases_df.assign(date_achat=dates, year_month=dates.dt.to_period('M'))
+    return {
+        'client_totals': purchases.groupby('client_id', sort=False).agg(
+            total_achat=('total_achat', 'sum'),
+            nombre_produits=('nombre_produits', 'sum'),
+            date_achat=('date_achat', 'max'),
+            achats=('total_achat', 'size')
+        ).reset_index(),
+        'monthly': purchases.groupby(['client_id', 'year_month'], sort=False).agg(
+            total_achat=('total_achat', 'sum'),
+            nombre_produits=('nombre_produits', 'sum')
+        ).reset_index(),
+        'category_spend': spend_by(items_df, AGGREGATE_KEYS['category_spend']),
+        'product_spend': spend_by(items_df, AGGREGATE_KEYS['product_spend'])
+    }
+
+def compact_frame(df, categoricals=None):
+    """Downcast a table: repeated strings to categoricals, integers to int32 and floats to float32.
+
+    categoricals optionally maps column names to the CategoricalDtype to use,
+    so that join keys share the same categories across tables.
+    """
+    categoricals = categoricals or {}
+    columns = {}
+    for column in df.columns:
+        values = df[column]
+        if column in COMPACT_CATEGORICALS:
+            columns[column] = values.astype(categoricals.get(column, 'category'))
+        elif pd.api.types.is_integer_dtype(values) and not pd.api.types.is_bool_dtype(values):
+            # Garder int64 si les valeurs ne tiennent pas sur 32 bits
+            if values.empty or (values.min() >= INT32_RANGE[0] and values.max() <= INT32_RANGE[1]):
+                columns[column] = values.astype(np.int32)
+        elif pd.api.types.is_float_dtype(values):
+            columns[column] = values.astype(np.float32)
+    compact = df.assign(**columns)
+    compact.attrs = dict(df.attrs)
+    return compact
+
+def compact_tables(loyalty_df, aggregates):
+    """Compact the loyalty table and the aggregates, sharing one client_id dtype between them."""
+    client_ids = pd.concat([loyalty_df['client_id']] + [table['client_id'] for table in aggregates.values()],
+                           ignore_index=True)
+    categoricals = {'client_id': pd.CategoricalDtype(pd.unique(client_ids.dropna()))}
+    return (compact_frame(loyalty_df, categoricals),
+            {name: compact_frame(table, categoricals) for name, table in aggregates.items()})
+
+def merge_aggregates(parts):
+    """Merge partial aggregates (as returned by aggregate_purchases) into one."""
+    merged = {}
+    for name, keys in AGGREGATE_KEYS.items():
+        frames = [part[name] for part in parts if not part[name].empty]
+        if not frames:
+            merged[name] = parts[0][name]
+            continue
+        combined = pd.concat(frames, ignore_index=True)
+        operations = {column: 'max' if column == 'date_achat' else 'sum'
+                      for column in combined.columns if column not in keys}
+        merged[name] = combined.groupby(keys, sort=False).agg(operations).reset_index()
+    return merged
+
+def iter_json_array(path, buffer_size=1 << 20):
+    """Yield the elements of a top-level JSON array one by one.
+
+    Only a read buffer and the element being decoded are held in memory.
+    """
+    decoder = json.JSONDecoder()
+    with open(path, 'r', encoding='utf-8-sig') as f:
+        buffer, pos = f.read(buffer_size), 0
+        opened = False
+        while True:
+            # Skip whitespace, the opening bracket and the separators between elements
+            while pos < len(buffer) and (buffer[pos].isspace() or buffer[pos] == ','
+                                         or (buffer[pos] == '[' and not opened)):
+                opened = opened or buffer[pos] == '['
+                pos += 1
+
+            if pos == len(buffer):
+                buffer, pos = f.read(buffer_size), 0
+                if not buffer:
+                    raise ValueError(f"Unexpected end of file in {path}")
+                continue
+            if not opened:
+                raise ValueError(f"{path} does not contain a JSON array")
+            if buffer[pos] == ']':
+                return
+
+            try:
+                element, end = decoder.raw_decode(buffer, pos)
+            except json.JSONDecodeError:
+                # The element continues past the end of the buffer
+                more = f.read(buffer_size)
+                if not more:
+                    raise
+                buffer, pos = buffer[pos:] + more, 0
+                continue
+
+            yield element
+            pos = end
+
+def iter_chunks(iterable, chunk_size):
+    """Group the items of an iterable into lists of at most chunk_size items."""
+    chunk = []
+    for item in iterable:
+        chunk.append(item)
+        if len(chunk) >= chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+def is_json_lines(path):
+    """Tell whether path holds newline-delimited JSON rather than a JSON array."""
+    if path.lower().endswith(JSON_LINES_EXTENSIONS):
+        return True
+    with open(path, 'rb') as f:
+        head = f.read(4096).lstrip(b'\xef\xbb\xbf \t\r\n')
+    return head[:1] == b'{'
+
+def iter_json_lines(path, start=0, end=None):
+    """Yield the records of a JSON Lines file whose line starts in [start, end)."""
+    with open(path, 'rb') as f:
+        f.seek(start)
+        position = start
+        for line in f:
+            if end is not None and position >= end:
+                break
+            position += len(line)
+            line = line.strip()
+            if line:
+                yield json.loads(line)
+
+def _line_ranges(path, n_ranges, size=None):
+    """Split the first `size` bytes of a file into up to n_ranges line-aligned byte ranges."""
+    size = os.path.getsize(path) if size is None else size
+    bounds = [0]
+    with open(path, 'rb') as f:
+        for i in range(1, n_ranges):
+            # Reading from the byte before the target lands on the next line start
+            f.seek(max(0, size * i // n_ranges - 1))
+            f.readline()
+            bounds.append(max(f.tell(), bounds[-1]))
+    bounds.append(size)
+    return [(start, end) for start, end in zip(bounds[:-1], bounds[1:]) if end > start]
+
+def _map_line_ranges(function, path, workers, *args, size=None):
+    """Run function(path, start, end, *args) over the byte ranges of a JSON Lines file.
+
+    Small files are handled in-process; larger ones are split across a
+    process pool. Results are returned in file order. Only the first `size`
+    bytes are read when given.
+    """
+    workers = workers or os.cpu_count() or 1
+    size = os.path.getsize(path) if size is None else size
+    ranges = _line_ranges(path, max(1, min(workers, size // RANGE_MIN_BYTES)), size)
+    if len(ranges) <= 1:
+        return [function(path, 0, size, *args)]
+    with ProcessPoolExecutor(max_workers=len(ranges)) as pool:
+        futures = [pool.submit(function, path, start, end, *args) for start, end in ranges]
+        return [future.result() for future in futures]
+
+def _json_lines_frame(path, start, end):
+    return pd.DataFrame(list(iter_json_lines(path, start, end)))
+
+def _json_lines_tables(path, start, end):
+    return flatten_purchases(list(iter_json_lines(path, start, end)))
+
+def _json_lines_aggregates(path, start, end, chunk_size):
+    return _aggregate_records(iter_json_lines(path, start, end), chunk_size)
+
+def _aggregate_records(records, chunk_size):
+    """Aggregate an iterable of purchase records chunk by chunk."""
+    state = aggregate_purchases(*flatten_purchases([]))
+    pending = []
+    for chunk in iter_chunks(records, chunk_size):
+        pending.append(aggregate_purchases(*flatten_purchases(chunk)))
+        # Fold the pending chunks into the running state every few chunks
+        if len(pending) >= 8:
+            state = merge_aggregates([state] + pending)
+            pending = []
+    return merge_aggregates([state] + pending)
+
+def stream_aggregates(path, chunk_size=DEFAULT_CHUNK_SIZE, workers=0):
+    """Aggregate a purchases file chunk by chunk without loading it whole."""
+    if is_json_lines(path):
+        return merge_aggregates(_map_line_ranges(_json_lines_aggregates, path, workers, chunk_size))
+    return _aggregate_records(iter_json_array(path), chunk_size)
+
+def load_loyalty(path, cache_dir=DEFAULT_CACHE_DIR, workers=0):
+    """Load the loyalty file as a DataFrame, using the binary cache when possible."""
+    cache_path = None
+    if cache_dir:
+        cache_path = cache_entry_path(cache_dir, path, 'loyalty', file_fingerprint(path))
+        cached = read_cache(cache_path, ['loyalty'])
+        if cached is not None:
+            return cached[0]
+
+    if is_json_lines(path):
+        loyalty_df = pd.concat(_map_line_ranges(_json_lines_frame, path, workers), ignore_index=True)
+    else:
+        with open(path, 'r', encoding='utf-8') as f:
+            loyalty_df = pd.DataFrame(json.load(f))
+    loyalty_df = _nested_to_text(loyalty_df)
+
+    if cache_path:
+        write_cache(cache_path, {'loyalty': loyalty_df})
+    return loyalty_df
+
+def load_purchases(path, workers=0):
+    """Load the purchases file as (purchases table, line-item table).
+
+    The tables are not cached: only their aggregates are (see
+    _purchase_aggregates).
+    """
+    if is_json_lines(path):
+        parts = _map_line_ranges(_json_lines_tables, path, workers)
+        purchases_df = pd.concat([part[0] for part in parts], ignore_index=True)
+        items_df = pd.concat([part[1] for part in parts], ignore_index=True)
+    else:
+        with open(path, 'r', encoding='utf-8') as f:
+            purchases_df, items_df = flatten_purchases(json.load(f))
+    return purchases_df, items_df
+
+def resolve_purchase_sources(path):
+    """Expand a purchases argument (file, directory or glob pattern) into a sorted list of files."""
+    if os.path.isdir(path):
+        sources = [os.path.join(path, name) for name in os.listdir(path)
+                   if name.lower().endswith(SHARD_EXTENSIONS)]
+    elif any(char in path for char in '*?['):
+        sources = [source for source in glob.glob(path) if os.path.isfile(source)]
+    else:
+        return [path]
+
+    if not sources:
+        raise FileNotFoundError(f"No purchase files found for {path}")
+    return sorted(sources)
+
+def _purchase_aggregates(path, cache_dir=DEFAULT_CACHE_DIR, stream=False,
+                         chunk_size=DEFAULT_CHUNK_SIZE, workers=0):
+    """Return the per-client aggregates of a single purchases file.
+
+    The aggregates are cached in both modes, so unchanged files skip the
+    grouping as well as the parsing.
+    """
+    names = list(AGGREGATE_KEYS)
+    cache_path = None
+    if cache_dir:
+        cache_path = cache_entry_path(cache_dir, path, 'aggregates', file_fingerprint(path))
+        cached = read_cache(cache_path, names)
+        if cached is not None:
+            return dict(zip(names, cached))
+
+    if stream:
+        aggregates = stream_aggregates(path, chunk_size=chunk_size, workers=workers)
+    else:
+        aggregates = aggregate_purchases(*load_purchases(path, workers=workers))
+    if cache_path:
+        write_cache(cache_path, aggregates)
+    return aggregates
+
+def _tail_digest(path, offset):
+    """Hash the bytes just before offset, to detect files rewritten rather than appended to."""
+    with open(path, 'rb') as f:
+        start = max(0, offset - 4096)
+        f.seek(start)
+        return hashlib.blake2b(f.read(offset - start), digest_size=16).hexdigest()
+
+def _complete_lines_end(path):
+    """Return the offset just past the last complete record of a JSON Lines file.
+
+    A trailing line without newline is only counted once it parses, so a file
+    still being appended to is never read halfway through a record.
+    """
+    size = os.path.getsize(path)
+    with open(path, 'rb') as f:
+        position = size
+        while position > 0:
+            start = max(0, position - (1 << 16))
+            f.seek(start)
+            block = f.read(position - start)
+            index = block.rfind(b'\n')
+            if index >= 0:
+                end = start + index + 1
+                break
+            position = start
+        else:
+            end = 0
+
+        f.seek(end)
+        tail = f.read().strip()
+    if tail:
+        try:
+            json.loads(tail)
+            return size
+        except ValueError:
+            pass
+    return end
+
+def incremental_aggregates(purchases_path, cache_dir=DEFAULT_CACHE_DIR, chunk_size=DEFAULT_CHUNK_SIZE, workers=0):
+    """Fold the purchases added since the last run into persisted aggregates.
+
+    The aggregate state is stored in the cache with one watermark per source
+    file: its size, mtime and the byte offset up to which it was read. New
+    shards are aggregated whole, JSON Lines files that grew are only read
+    from their offset, and unchanged files are skipped. A file that was
+    rewritten or removed triggers a full rebuild.
+    """
+    if not cache_dir:
+        raise ValueError('Incremental ingestion needs a cache directory')
+
+    names = list(AGGREGATE_KEYS)
+    state_path = cache_entry_path(cache_dir, purchases_path, 'state', 'latest')
+    sources = resolve_purchase_sources(purchases_path)
+
+    state, watermarks = None, {}
+    cached = read_cache(state_path, names + ['watermarks'])
+    if cached is not None:
+        state = dict(zip(names, cached[:-1]))
+        watermarks = {mark['path']: mark for mark in cached[-1].to_dict(orient='records')}
+
+    # Work out where to resume reading each source
+    plan = []
+    rebuild = state is None or not set(watermarks) <= set(sources)
+    for source in sources:
+        if rebuild:
+            break
+        stat = os.stat(source)
+        mark = watermarks.get(source)
+        if mark is None:
+            plan.append((source, 0))
+        elif stat.st_size == mark['size'] and stat.st_mtime_ns == mark['mtime_ns']:
+            continue
+        elif is_json_lines(source) and stat.st_size >= mark['offset'] \
+                and _tail_digest(source, mark['offset']) == mark['digest']:
+            plan.append((source, mark['offset']))
+        else:
+            logger.info(f"{source} was rewritten, rebuilding the aggregate state")
+            rebuild = True
+
+    if rebuild:
+        state, watermarks = None, {}
+        plan = [(source, 0) for source in sources]
+    if not plan:
+        return state
+
+    deltas = []
+    for source, start in plan:
+        stat = os.stat(source)
+        if is_json_lines(source):
+            end = _complete_lines_end(source)
+            if start == 0:
+                deltas.append(merge_aggregates(
+                    _map_line_ranges(_json_lines_aggregates, source, workers, chunk_size, size=end)))
+            else:
+                deltas.append(_aggregate_records(iter_json_lines(source, start, end), chunk_size))
+        else:
+            end = stat.st_size
+            deltas.append(stream_aggregates(source, chunk_size=chunk_size))
+        watermarks[source] = {'path': source, 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns,
+                              'offset': end, 'digest': _tail_digest(source, end)}
+    logger.info(f"Folded new purchases from {len(plan)} file(s) into the aggregate state")
+
+    aggregates = merge_aggregates(([state] if state is not None else []) + deltas)
+    write_cache(state_path, dict(aggregates, watermarks=pd.DataFrame(list(watermarks.values()))))
+    return aggregates
+
+def load_aggregates(loyalty_path, purchases_path, cache_dir=DEFAULT_CACHE_DIR,
+                    stream=False, chunk_size=DEFAULT_CHUNK_SIZE, workers=0, incremental=False, compact=False):
+    """Load the loyalty table and the per-client purchase aggregates.
+
+    In streaming mode the purchases file is never materialized: records are
+    aggregated in chunks of chunk_size. The aggregates of each purchases
+    file are cached in both modes.
+    JSON Lines inputs are parsed in parallel over `workers` processes.
+
+    purchases_path may also be a directory or a glob pattern of daily
+    exports: each shard is then aggregated on its own (map), in parallel,
+    and the partial aggregates are merged in shard order (reduce).
+
+    In incremental mode only the purchases added since the previous run are
+    read (see incremental_aggregates).
+
+    In compact mode the returned tables are downcast with compact_tables;
+    the cache always holds the full-width tables.
+    """
+    loyalty_df = load_loyalty(loyalty_path, cache_dir=cache_dir, workers=workers)
+    if incremental:
+        aggregates = incremental_aggregates(purchases_path, cache_dir=cache_dir,
+                                            chunk_size=chunk_size, workers=workers)
+        return compact_tables(loyalty_df, aggregates) if compact else (loyalty_df, aggregates)
+
+    options = {'cache_dir': cache_dir, 'stream': stream, 'chunk_size': chunk_size}
+    sources = resolve_purchase_sources(purchases_path)
+    if sources == [purchases_path]:
+        aggregates = _purchase_aggregates(purchases_path, workers=workers, **options)
+    else:
+        workers = min(workers or os.cpu_count() or 1, len(sources))
+        if workers == 1:
+            parts = [_purchase_aggregates(source, workers=1, **options) for source in sources]
+        else:
+            # Each shard worker parses its file on a single core
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                parts = list(pool.map(functools.partial(_purchase_aggregates, workers=1, **options), sources))
+        aggregates = merge_aggregates(parts)
+    return compact_tables(loyalty_df, aggregates) if compact else (loyalty_df, aggregates)
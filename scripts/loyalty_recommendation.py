@@ -4,14 +4,13 @@
 import json
 import argparse
 import numpy as np
-import pandas as pd
-from sklearn.cluster import KMeans
 from sklearn.preprocessing import StandardScaler
-from sklearn.decomposition import PCA
-from sklearn.metrics.pairwise import cosine_similarity
 import sys
 import logging
 import warnings
+import ingestion
+import features as feature_store
+import segmentation
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, stream=sys.stderr, format='%(message)s')
@@ -164,64 +163,21 @@ PRODUCT_LOYALTY_MAPPING = {
     }
 }
 
-def load_data(loyalty_path, purchases_path):
+def load_data(loyalty_path, purchases_path, **ingest_options):
     """Load and merge customer data from loyalty and purchases JSON files."""
     try:
-        # Load loyalty data
-        with open(loyalty_path, 'r', encoding='utf-8') as f:
-            loyalty_data = json.load(f)
+        # Load the per-customer feature table and the purchase aggregates
+        table, aggregates = feature_store.load_feature_table(loyalty_path, purchases_path, **ingest_options)
         
-        # Load purchases data
-        with open(purchases_path, 'r', encoding='utf-8') as f:
-            purchases_data = json.load(f)
-        
-        # Convert to pandas DataFrames
-        loyalty_df = pd.DataFrame(loyalty_data)
-        
-        # Extract purchase info and product preferences
-        purchase_info = []
+        # Sum product costs per client and category
         product_categories = {}
+        category_spend = aggregates['category_spend']
+        for client_id, category, amount in zip(
+                category_spend['client_id'], category_spend['categorie'], category_spend['amount']):
+            product_categories.setdefault(client_id, {})[category] = amount
         
-        for purchase in purchases_data:
-            client_id = purchase.get('Client_ID')
-            total_achat = purchase.get('Total_Achat (€)', 0)
-            nombre_produits = purchase.get('Nombre_Produits', 0)
-            
-            # Process products in purchase
-            if 'Produits' in purchase and client_id:
-                if client_id not in product_categories:
-                    product_categories[client_id] = {}
-                
-                for product in purchase['Produits']:
-                    category = product.get('Catégorie', 'Autre')
-                    cost = product.get('Total_Coût_Produit (€)', 0)
-                    
-                    if category not in product_categories[client_id]:
-                        product_categories[client_id][category] = 0
-                    
-                    product_categories[client_id][category] += cost
-            
-            purchase_info.append({
-                'client_id': client_id,
-                'total_achat': total_achat,
-                'nombre_produits': nombre_produits
-            })
-        
-        purchases_df = pd.DataFrame(purchase_info)
-        
-        # Aggregate purchases by client
-        purchases_agg = purchases_df.groupby('client_id').agg({
-            'total_achat': 'sum',
-            'nombre_produits': 'sum'
-        }).reset_index()
-        
-        # Merge dataframes
-        combined_df = pd.merge(loyalty_df, purchases_agg, on='client_id', how='left')
-        
-        # Add additional features
-        if 'points_cumules' in combined_df.columns and 'nombre_achats' in combined_df.columns:
-            combined_df['points_par_achat'] = combined_df['points_cumules'] / combined_df['nombre_achats'].replace(0, 1)
-            combined_df['panier_moyen'] = combined_df['total_achat'] / combined_df['nombre_achats'].replace(0, 1)
+        # Loyalty data, purchase totals and derived ratios (points_par_achat, panier_moyen)
+        combined_df = feature_store.select_features(table, 'loyalty', 'total_achat', 'nombre_produits', 'ratios')
         
         return combined_df, product_categories
     
@@ -229,8 +185,13 @@ def load_data(loyalty_path, purchases_path):
         logger.error(f"Error loading data: {str(e)}")
         sys.exit(1)
 
-def segment_customers(df, n_clusters=5):
-    """Segment customers based on their characteristics."""
+def segment_customers(df, n_clusters=5, dtype=np.float64, engine='kmeans', batch_size=segmentation.DEFAULT_BATCH_SIZE):
+    """Segment customers based on their characteristics.
+    
+    Features are scaled and clustered as `dtype` (float32 in compact mode)
+    with an engine of segmentation.CLUSTERING_ENGINES. Returns the segmented
+    rows, the segments and the inertia of the clustering.
+    """
     try:
         # Select features for segmentation
         features = ['age', 'points_cumules', 'nombre_achats', 'panier_moyen', 'points_par_achat']
@@ -241,7 +202,7 @@ def segment_customers(df, n_clusters=5):
             sys.exit(1)
         
         # Prepare data
-        X = df[features].copy()
+        X = df[features].astype(dtype)
         X.fillna(X.mean(), inplace=True)
         
         # Scale features
@@ -249,8 +210,7 @@ def segment_customers(df, n_clusters=5):
         X_scaled = scaler.fit_transform(X)
         
         # Apply clustering
-        kmeans = KMeans(n_clusters=n_clusters, random_state=42, n_init=10)
-        clusters = kmeans.fit_predict(X_scaled)
+        clusters, _, inertia = segmentation.fit_clusters(X_scaled, n_clusters, engine, batch_size)
         
         # Add cluster to dataframe
         df_with_clusters = df.copy()
@@ -270,7 +230,7 @@ def segment_customers(df, n_clusters=5):
             
             # Feature averages
             for feature in features:
-                segment[f'{feature}_mean'] = round(segment_data[feature].mean(), 2)
+                segment[f'{feature}_mean'] = round(float(segment_data[feature].mean()), 2)
             
             # Determine segment characteristics
             if 'age' in features and 'age_mean' in segment:
@@ -328,7 +288,7 @@ def segment_customers(df, n_clusters=5):
             
             segments.append(segment)
         
-        return df_with_clusters, segments
+        return df_with_clusters, segments, inertia
     
     except Exception as e:
         logger.error(f"Error in customer segmentation: {str(e)}")
@@ -529,18 +489,22 @@ def recommend_product_loyalty_programs(product_categories):
 
 def main():
     parser = argparse.ArgumentParser(description='Loyalty Program Recommendation System')
-    parser.add_argument('--loyalty', required=True, help='Path to the loyalty points JSON file')
-    parser.add_argument('--purchases', required=True, help='Path to the purchases JSON file')
+    parser.add_argument('--loyalty', required=True, help='Path to the loyalty points JSON or JSON Lines file')
+    parser.add_argument('--purchases', required=True, help='Path to the purchases JSON or JSON Lines file, or a directory / glob pattern of daily exports')
     parser.add_argument('--segments', type=int, default=5, help='Number of customer segments to create')
+    segmentation.add_clustering_arguments(parser)
+    ingestion.add_ingestion_arguments(parser)
     
     args = parser.parse_args()
     
     try:
         # Load data
-        df, product_categories = load_data(args.loyalty, args.purchases)
+        df, product_categories = load_data(args.loyalty, args.purchases, **ingestion.ingestion_options(args))
         
         # Segment customers
-        df_with_segments, segments = segment_customers(df, args.segments)
+        df_with_segments, segments, inertia = segment_customers(
+            df, args.segments, dtype=np.float32 if args.compact else np.float64,
+            engine=args.engine, batch_size=args.batch_size)
         
         # Recommend loyalty programs for segments
         segment_recommendations = recommend_loyalty_programs(segments, product_categories)
@@ -552,7 +516,9 @@ def main():
         results = {
             'segment_recommendations': segment_recommendations,
             'product_recommendations': product_recommendations,
-            'segments': segments
+            'segments': segments,
+            'engine': args.engine,
+            'inertia': round(float(inertia), 2)
         }
         
         # Output results as JSON
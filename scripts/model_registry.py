@@ -0,0 +1,119 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Local registry of trained prediction models.
+
+An artifact bundles the fitted model, its scaler, the feature list and the
+evaluation metrics. Artifacts are stored as joblib files named after a key
+built from the data version, the hyperparameters and the features, so a
+prediction on unchanged data can skip training entirely.
+"""
+
+import os
+import json
+import hashlib
+import logging
+from datetime import datetime
+import joblib
+
+logger = logging.getLogger('model_registry')
+
+# Bump when the content of an artifact changes
+REGISTRY_VERSION = 3
+
+# Artifacts kept in a registry directory, the least recently written are removed first
+MAX_MODELS = 20
+
+def registry_dir(cache_dir):
+    """Directory of the registry inside the ingestion cache, or None when caching is disabled."""
+    return os.path.join(cache_dir, 'models') if cache_dir else None
+
+def model_key(data_version, hyperparameters, features):
+    """Return the registry key of a model trained on data_version with these settings."""
+    payload = json.dumps({
+        'registry': REGISTRY_VERSION,
+        'data': data_version,
+        'hyperparameters': hyperparameters,
+        'features': list(features)
+    }, sort_keys=True)
+    return hashlib.blake2b(payload.encode('utf-8'), digest_size=16).hexdigest()
+
+def model_path(directory, key):
+    return os.path.join(directory, f"{key}.joblib")
+
+def latest_model(directory, config_key):
+    """Return (path, artifact) of the last model saved for a configuration (see set_latest_model), or (None, None)."""
+    try:
+        with open(os.path.join(directory, f"{config_key}.latest.json"), 'r', encoding='utf-8') as f:
+            path = json.load(f)['path']
+    except (OSError, ValueError, KeyError):
+        return None, None
+    artifact = load_model(path)
+    return (path, artifact) if artifact is not None else (None, None)
+
+def set_latest_model(directory, config_key, path):
+    """Record path as the last model saved for a configuration, whatever its data version."""
+    pointer = os.path.join(directory, f"{config_key}.latest.json")
+    try:
+        os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{pointer}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'path': os.path.abspath(path)}, f)
+        os.replace(tmp_path, pointer)
+    except OSError as e:
+        logger.warning(f"Could not write model pointer {pointer}: {str(e)}")
+
+def tuning_path(directory, key):
+    return os.path.join(directory, f"{key}.params.json")
+
+def load_tuned_params(path):
+    """Return the hyperparameters saved by save_tuned_params, or None."""
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)['params']
+    except (OSError, ValueError, KeyError):
+        return None
+
+def save_tuned_params(path, params):
+    """Atomically write the best hyperparameters of a search."""
+    try:
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'params': params, 'tuned_at': datetime.now().isoformat(timespec='seconds')}, f)
+        os.replace(tmp_path, path)
+    except OSError as e:
+        logger.warning(f"Could not write tuning file {path}: {str(e)}")
+
+def load_model(path):
+    """Load an artifact written by save_model, or return None if unavailable."""
+    if not os.path.exists(path):
+        return None
+    try:
+        artifact = joblib.load(path)
+    except Exception as e:
+        logger.warning(f"Ignoring unreadable model file {path}: {str(e)}")
+        return None
+    if not isinstance(artifact, dict) or artifact.get('registry_version') != REGISTRY_VERSION:
+        logger.warning(f"Ignoring model file {path} written by another registry version")
+        return None
+    return artifact
+
+def save_model(path, artifact):
+    """Atomically write an artifact (a dict) to path and return the saved artifact."""
+    artifact = dict(artifact, registry_version=REGISTRY_VERSION,
+                    trained_at=artifact.get('trained_at') or datetime.now().isoformat(timespec='seconds'))
+    try:
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        joblib.dump(artifact, tmp_path)
+        os.replace(tmp_path, path)
+
+        # Drop the oldest artifacts (models of older data versions)
+        directory = os.path.dirname(os.path.abspath(path))
+        entries = sorted((os.path.join(directory, entry) for entry in os.listdir(directory)
+                          if entry.endswith('.joblib')), key=os.path.getmtime, reverse=True)
+        for entry in entries[MAX_MODELS:]:
+            os.remove(entry)
+    except OSError as e:
+        logger.warning(f"Could not write model file {path}: {str(e)}")
+    return artifact
@@ -5,16 +5,23 @@ import json
 import argparse
 import numpy as np
 import pandas as pd
-from sklearn.linear_model import LinearRegression
-from sklearn.ensemble import GradientBoostingRegressor
-from sklearn.model_selection import train_test_split, TimeSeriesSplit, cross_val_score
+from sklearn.ensemble import GradientBoostingRegressor, HistGradientBoostingRegressor
+from sklearn.model_selection import train_test_split, TimeSeriesSplit, cross_validate
+from sklearn.experimental import enable_halving_search_cv  # noqa: F401 (active HalvingGridSearchCV)
+from sklearn.model_selection import HalvingGridSearchCV
 from sklearn.preprocessing import StandardScaler
 from sklearn.metrics import mean_squared_error, r2_score, mean_absolute_error
-from datetime import datetime, timedelta
+from datetime import timedelta
 import sys
 import warnings
 import logging
 import random
+import time
+import os
+import copy
+import ingestion
+import features as feature_store
+import model_registry
 
 # Configure logging to write to stderr instead of stdout
 logging.basicConfig(level=logging.INFO, stream=sys.stderr, format='%(message)s')
@@ -23,181 +30,76 @@ logger = logging.getLogger('prediction')
 # Suppress warnings
 warnings.filterwarnings("ignore")
 
-def load_data(loyalty_path, purchases_path):
-    """Load and merge customer data from loyalty and purchases JSON files."""
+# Hyperparamètres des moteurs de prédiction (font partie de la clé du registre de modèles)
+GBR_PARAMS = {'n_estimators': 100, 'learning_rate': 0.1, 'max_depth': 3, 'random_state': 42}
+# Boosting sur histogrammes : arrêt anticipé sur 10 % des données d'entraînement
+HIST_PARAMS = {'max_iter': 200, 'learning_rate': 0.1, 'early_stopping': True, 'validation_fraction': 0.1,
+               'n_iter_no_change': 10, 'random_state': 42}
+
+# Grilles explorées par --tune (recherche par divisions successives)
+TUNING_GRIDS = {
+    'gbr': {'n_estimators': [50, 100, 200, 400], 'learning_rate': [0.03, 0.1, 0.3], 'max_depth': [2, 3, 4, 5]},
+    'hist': {'learning_rate': [0.03, 0.1, 0.3], 'max_depth': [None, 3, 6], 'max_leaf_nodes': [15, 31, 63],
+             'l2_regularization': [0.0, 1.0]}
+}
+
+# Facteur d'échelle des prédictions mensuelles et horizon en jours de chaque période
+PERIODS = ['day', 'week', 'month', 'quarter']
+PERIOD_FACTORS = {'day': 1/30, 'week': 1/4, 'month': 1, 'quarter': 3}
+PERIOD_DAYS = {'day': 1, 'week': 7, 'month': 30, 'quarter': 90}
+
+# Nombre de clients traités par lot en mode batch (--output) et taille du classement par défaut
+DEFAULT_BATCH_SIZE = 10000
+DEFAULT_TOP_K = 100
+
+# Mise à jour incrémentale (--update) : étapes de boosting ajoutées par mise à jour et au total depuis
+# le dernier entraînement complet, clients récents minimum, part des clients (récents et anciens)
+# réservée au contrôle, et dérive tolérée du RMSE sur les clients récents par rapport au RMSE de référence
+UPDATE_STAGES = 50
+MAX_UPDATE_STAGES = 150
+MIN_UPDATE_ROWS = 50
+UPDATE_HOLDOUT = 0.2
+DRIFT_TOLERANCE = 0.25
+
+ENGINES = {
+    'gbr': ('XGBoost', GradientBoostingRegressor, GBR_PARAMS),
+    'hist': ('HistGradientBoosting', HistGradientBoostingRegressor, HIST_PARAMS)
+}
+
+def load_data(loyalty_path, purchases_path, as_of=None, **ingest_options):
+    """Load and merge customer data from loyalty and purchases JSON files.
+    
+    Recency features are computed relative to as_of (today by default).
+    """
     try:
-        # Load loyalty data
-        with open(loyalty_path, 'r', encoding='utf-8') as f:
-            loyalty_data = json.load(f)
-        
-        # Load purchases data
-        with open(purchases_path, 'r', encoding='utf-8') as f:
-            purchases_data = json.load(f)
-        
-        # Convert to pandas DataFrames
-        loyalty_df = pd.DataFrame(loyalty_data)
-        
-        # Extract basic purchase info and convert dates
-        purchase_info = []
-        product_preferences = {}  # Store product preferences by client
-        
-        for purchase in purchases_data:
-            client_id = purchase.get('Client_ID')
-            date_achat = purchase.get('Date_Achat', '')
-            total_achat = purchase.get('Total_Achat (€)', 0)
-            nombre_produits = purchase.get('Nombre_Produits', 0)
-            
-            # Extract product categories and preferences
-            if 'Produits' in purchase and client_id:
-                if client_id not in product_preferences:
-                    product_preferences[client_id] = {}
-                
-                for product in purchase['Produits']:
-                    category = product.get('Catégorie', 'Autre')
-                    product_name = product.get('Nom_Produit', 'Inconnu')
-                    cost = product.get('Total_Coût_Produit (€)', 0)
-                    
-                    # Update category preferences
-                    if category not in product_preferences[client_id]:
-                        product_preferences[client_id][category] = {
-                            'count': 0,
-                            'total_amount': 0,
-                            'products': {}
-                        }
-                    
-                    product_preferences[client_id][category]['count'] += 1
-                    product_preferences[client_id][category]['total_amount'] += cost
-                    
-                    # Update specific product preferences
-                    if product_name not in product_preferences[client_id][category]['products']:
-                        product_preferences[client_id][category]['products'][product_name] = {
-                            'count': 0,
-                            'total_amount': 0
-                        }
-                    
-                    product_preferences[client_id][category]['products'][product_name]['count'] += 1
-                    product_preferences[client_id][category]['products'][product_name]['total_amount'] += cost
-            
-            # Add the purchase data
-            purchase_info.append({
-                'client_id': client_id,
-                'date_achat': date_achat,
-                'total_achat': total_achat,
-                'nombre_produits': nombre_produits
-            })
-        
-        purchases_df = pd.DataFrame(purchase_info)
-        
-        # Convert date strings to datetime objects
-        if 'date_achat' in purchases_df.columns:
-            purchases_df['date_achat'] = pd.to_datetime(purchases_df['date_achat'], errors='coerce')
-        
-        if 'dernier_achat' in loyalty_df.columns:
-            loyalty_df['dernier_achat'] = pd.to_datetime(loyalty_df['dernier_achat'], errors='coerce')
-        
-        if 'date_inscription' in loyalty_df.columns:
-            loyalty_df['date_inscription'] = pd.to_datetime(loyalty_df['date_inscription'], errors='coerce')
-        
-        # Group purchases by client and date to create time series features
-        if 'date_achat' in purchases_df.columns:
-            # Aggregate purchases by client and month
-            purchases_df['year_month'] = purchases_df['date_achat'].dt.to_period('M')
-            time_series = purchases_df.groupby(['client_id', 'year_month']).agg({
-                'total_achat': 'sum',
-                'nombre_produits': 'sum'
-            }).reset_index()
-            
-            # Sort by client and date
-            time_series = time_series.sort_values(['client_id', 'year_month'])
-            
-            # Calculate moving averages and trends for each client
-            client_time_features = {}
-            for client_id, group in time_series.groupby('client_id'):
-                if len(group) >= 3:  # Need at least 3 data points for meaningful time series
-                    group = group.sort_values('year_month')
-                    
-                    # Calculate 3-month moving average
-                    rolling_avg = group['total_achat'].rolling(window=3, min_periods=1).mean().iloc[-1]
-                    
-                    # Calculate trend (simple linear regression on last 6 points or all if less)
-                    n_points = min(6, len(group))
-                    recent_data = group.iloc[-n_points:]
-                    x = np.arange(len(recent_data)).reshape(-1, 1)
-                    y = recent_data['total_achat'].values
-                    trend_model = LinearRegression()
-                    trend_model.fit(x, y)
-                    trend = trend_model.coef_[0]  # Slope indicates trend direction
-                    
-                    # Calculate seasonality (if we have enough data)
-                    seasonality = 0
-                    if len(group) >= 12:  # Need at least a year of data
-                        # Convert period to month number
-                        group['month'] = group['year_month'].dt.month
-                        monthly_avg = group.groupby('month')['total_achat'].mean()
-                        overall_avg = group['total_achat'].mean()
-                        # Seasonality strength based on variance of monthly averages
-                        seasonality = monthly_avg.std() / overall_avg if overall_avg > 0 else 0
-                    
-                    client_time_features[client_id] = {
-                        'rolling_avg': rolling_avg,
-                        'trend': trend,
-                        'seasonality': seasonality,
-                        'volatility': group['total_achat'].std(),
-                        'max_purchase': group['total_achat'].max(),
-                        'last_purchase': group['total_achat'].iloc[-1],
-                        'purchase_count': len(group),
-                        'total_spent': group['total_achat'].sum(),
-                        'avg_purchase': group['total_achat'].mean()
-                    }
-                else:
-                    # Not enough data for time series analysis
-                    avg_purchase = group['total_achat'].mean() if len(group) > 0 else 0
-                    client_time_features[client_id] = {
-                        'rolling_avg': avg_purchase,
-                        'trend': 0,
-                        'seasonality': 0,
-                        'volatility': 0,
-                        'max_purchase': group['total_achat'].max() if len(group) > 0 else 0,
-                        'last_purchase': group['total_achat'].iloc[-1] if len(group) > 0 else 0,
-                        'purchase_count': len(group),
-                        'total_spent': group['total_achat'].sum() if len(group) > 0 else 0,
-                        'avg_purchase': avg_purchase
-                    }
-        else:
-            # No date information, create empty features
-            client_time_features = {client_id: {
-                'rolling_avg': 0, 'trend': 0, 'seasonality': 0, 'volatility': 0,
-                'max_purchase': 0, 'last_purchase': 0, 'purchase_count': 0,
-                'total_spent': 0, 'avg_purchase': 0
-            } for client_id in loyalty_df['client_id'].unique()}
-        
-        # Merge dataframes on client_id
-        combined_df = pd.merge(loyalty_df, purchases_df.groupby('client_id').agg({
-            'total_achat': 'sum',
-            'nombre_produits': 'sum',
-            'date_achat': 'max'
-        }).reset_index(), on='client_id', how='left')
+        # Load the per-customer feature table and the purchase aggregates
+        table, aggregates = feature_store.load_feature_table(loyalty_path, purchases_path, **ingest_options)
+        
+        # Monthly purchases by client, sorted by client and date
+        time_series = aggregates['monthly'].sort_values(['client_id', 'year_month'])
+        
+        # Loyalty data, purchase totals and time series features (ts_*)
+        combined_df = feature_store.select_features(table, 'loyalty', 'purchases', 'time_series')
+        client_time_features = combined_df.set_index('client_id')[feature_store.FEATURE_GROUPS['time_series']]
         
         # Add time-based features
-        if 'dernier_achat' in combined_df.columns and 'date_inscription' in combined_df.columns:
-            combined_df['jours_depuis_inscription'] = (datetime.now() - combined_df['date_inscription']).dt.days
-            combined_df['jours_depuis_dernier_achat'] = (datetime.now() - combined_df['dernier_achat']).dt.days
-            combined_df['frequence_achat'] = combined_df['jours_depuis_inscription'] / combined_df['nombre_achats']
+        combined_df = feature_store.add_recency_features(combined_df, as_of)
         
-        # Add time series features to combined_df
-        for feature in ['rolling_avg', 'trend', 'seasonality', 'volatility', 'max_purchase', 
-                       'last_purchase', 'purchase_count', 'total_spent', 'avg_purchase']:
-            combined_df[f'ts_{feature}'] = combined_df['client_id'].map(
-                lambda x: client_time_features.get(x, {}).get(feature, 0))
+        # Top categories and products of each client, aligned with the rows of combined_df
+        product_preferences = feature_store.preference_index(
+            combined_df['client_id'], aggregates['category_spend'], aggregates['product_spend'])
         
-        return combined_df, purchases_df, product_preferences, client_time_features
+        return combined_df, time_series, product_preferences, client_time_features
     
     except Exception as e:
         logger.error(f"Error loading data: {str(e)}")
         sys.exit(1)
 
-def prepare_prediction_data(df, features, use_time_series=True):
-    """Prepare data for prediction model."""
+def prepare_prediction_data(df, features, use_time_series=True, dtype=np.float64):
+    """Prepare data for prediction model.
+    
+    Features are scaled as `dtype` (float32 in compact mode).
+    """
     try:
         # Add time series features if requested
         if use_time_series:
@@ -207,7 +109,7 @@ def prepare_prediction_data(df, features, use_time_series=True):
             all_features = features
             
         # Select relevant features
-        X = df[all_features].copy()
+        X = df[all_features].astype(dtype)
         
         # Target variable - total purchase amount or number of purchases
         y_amount = df['total_achat'] if 'total_achat' in df.columns else None
@@ -226,29 +128,43 @@ def prepare_prediction_data(df, features, use_time_series=True):
         logger.error(f"Error preparing prediction data: {str(e)}")
         sys.exit(1)
 
-def evaluate_models(X, y, time_series=True, test_size=0.2):
-    """Train a Gradient Boosting model and evaluate it."""
+def evaluate_models(X, y, time_series=True, test_size=0.2, params=None, keep_fold_models=False, engine='gbr'):
+    """Train a Gradient Boosting model of the given engine (see ENGINES) and evaluate it.
+    
+    With time_series, each TimeSeriesSplit fold is fitted once and scored on
+    every metric; the fold models are also returned when keep_fold_models.
+    """
     try:
         # Create the model
-        model = GradientBoostingRegressor(n_estimators=100, learning_rate=0.1, max_depth=3, random_state=42)
+        model_name, estimator, default_params = ENGINES[engine]
+        model = estimator(**(params or default_params))
+        fold_models = None
+        fold_metrics = []
         
         # Preparation for evaluation
         if time_series:
-            # Use TimeSeriesSplit for time series data
+            # Use TimeSeriesSplit for time series data, one fit per fold for all metrics
             cv = TimeSeriesSplit(n_splits=5)
-            scores_mse = cross_val_score(model, X, y, cv=cv, scoring='neg_mean_squared_error', n_jobs=-1)
-            mse = -scores_mse.mean()
-            scores_r2 = cross_val_score(model, X, y, cv=cv, scoring='r2', n_jobs=-1)
-            r2 = scores_r2.mean()
-            scores_mae = cross_val_score(model, X, y, cv=cv, scoring='neg_mean_absolute_error', n_jobs=-1)
-            mae = -scores_mae.mean()
+            scores = cross_validate(model, X, y, cv=cv, n_jobs=-1, return_estimator=keep_fold_models,
+                                    scoring=('neg_mean_squared_error', 'r2', 'neg_mean_absolute_error'))
+            mse = -scores['test_neg_mean_squared_error'].mean()
+            r2 = scores['test_r2'].mean()
+            mae = -scores['test_neg_mean_absolute_error'].mean()
+            fold_metrics = [{'mse': -fold_mse, 'r2': fold_r2, 'mae': -fold_mae} for fold_mse, fold_r2, fold_mae in zip(
+                scores['test_neg_mean_squared_error'], scores['test_r2'], scores['test_neg_mean_absolute_error'])]
+            if keep_fold_models:
+                fold_models = list(scores['estimator'])
             
             # Train model on all data
+            start = time.perf_counter()
             model.fit(X, y)
+            training_time = time.perf_counter() - start
         else:
             # Simple train/test split for non-time series data
             X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=test_size, random_state=42)
+            start = time.perf_counter()
             model.fit(X_train, y_train)
+            training_time = time.perf_counter() - start
             y_pred = model.predict(X_test)
             mse = mean_squared_error(y_test, y_pred)
             r2 = r2_score(y_test, y_pred)
@@ -259,22 +175,169 @@ def evaluate_models(X, y, time_series=True, test_size=0.2):
             'mse': mse,
             'rmse': np.sqrt(mse),
             'r2': r2,
-            'mae': mae
+            'mae': mae,
+            'training_time': training_time,
+            'folds': fold_metrics
         }
         
-        logger.info(f"XGBoost: R2 = {r2:.4f}, RMSE = {np.sqrt(mse):.2f}, MAE = {mae:.2f}")
+        logger.info(f"{model_name}: R2 = {r2:.4f}, RMSE = {np.sqrt(mse):.2f}, MAE = {mae:.2f}, "
+                    f"training time = {training_time:.3f}s")
         
         # Create results for display
-        all_models_metrics = {'XGBoost': {'r2': round(r2, 4)}}
+        all_models_metrics = {model_name: {'r2': round(r2, 4)}}
         
-        return model, 'XGBoost', metrics, {'XGBoost': metrics}, all_models_metrics
+        return model, model_name, metrics, {model_name: metrics}, all_models_metrics, fold_models
     
     except Exception as e:
         logger.error(f"Error evaluating model: {str(e)}")
         sys.exit(1)
 
-def predict_future_purchases(df, purchases_df, best_model, scaler, features, product_preferences, time_features, period='month'):
-    """Predict future purchases for each client for the specified period."""
+def tune_hyperparameters(X, y, engine='gbr'):
+    """Search the hyperparameters of an engine with successive halving over TimeSeriesSplit folds.
+    
+    Candidates are evaluated in parallel (n_jobs=-1); returns the best parameters of TUNING_GRIDS[engine].
+    """
+    try:
+        model_name, estimator, default_params = ENGINES[engine]
+        start = time.perf_counter()
+        search = HalvingGridSearchCV(estimator(**default_params), TUNING_GRIDS[engine], cv=TimeSeriesSplit(n_splits=5),
+                                     scoring='neg_mean_squared_error', factor=3, refit=False, n_jobs=-1, random_state=42)
+        search.fit(X, y)
+        logger.info(f"{model_name}: best parameters {search.best_params_} "
+                    f"(RMSE = {np.sqrt(-search.best_score_):.2f}, search time = {time.perf_counter() - start:.1f}s)")
+        return search.best_params_
+    
+    except Exception as e:
+        logger.error(f"Error tuning model: {str(e)}")
+        sys.exit(1)
+
+def data_cutoff(df):
+    """Date of the last purchase in the data, the start of the 'recent' clients of the next update."""
+    return pd.to_datetime(df['date_achat'], errors='coerce').max()
+
+def update_model(artifact, df, dtype=np.float64, stages=UPDATE_STAGES, drift_tolerance=DRIFT_TOLERANCE):
+    """Warm-start a trained artifact with the clients who purchased after its data cutoff.
+    
+    A random UPDATE_HOLDOUT share of all clients, recent and older, is kept
+    out of the update. The gbr model keeps its scaler and gains `stages`
+    trees fitted on the other recent clients; its metrics are then measured
+    on the held-out clients. Returns the updated artifact, or None when a
+    full retrain is needed: the model drifted (its RMSE on the recent clients
+    exceeds (1 + drift_tolerance) times its reference RMSE), too few recent
+    clients, more than MAX_UPDATE_STAGES trees added since the last full
+    training, an update that does worse than the model it started from on
+    the held-out recent clients or drifts on all held-out clients, or an
+    engine that cannot be warm-started.
+    """
+    try:
+        if not isinstance(artifact['model'], GradientBoostingRegressor):
+            # HistGradientBoosting recalcule ses histogrammes à chaque fit : ses arbres ne valent que pour les données d'origine
+            logger.info(f"{artifact['model_name']} cannot be warm-started on new data")
+            return None
+        
+        cutoff = pd.Timestamp(artifact['data_cutoff'])
+        recent = (pd.to_datetime(df['date_achat'], errors='coerce') > cutoff).to_numpy()
+        n_recent = int(recent.sum())
+        if n_recent == 0:
+            logger.info(f"No purchase since {cutoff.date()}, model unchanged")
+            return dict(artifact, metrics=dict(artifact['metrics'], training_time=0.0))
+        if n_recent < MIN_UPDATE_ROWS:
+            logger.info(f"Only {n_recent} recent clients, too few for an update")
+            return None
+        stages_added = artifact.get('stages_added', 0) + stages
+        if stages_added > MAX_UPDATE_STAGES:
+            logger.info(f"{stages_added - stages} trees already added since the last full training, retraining")
+            return None
+        
+        # Same preparation as scoring, with the scaler of the trained model
+        X = df[artifact['features_used']].astype(dtype)
+        X_scaled = artifact['scaler'].transform(X.fillna(X.mean()))
+        y = df['total_achat'].to_numpy(dtype=float)
+        
+        # Drift check on the recent clients before adding stages
+        model = copy.deepcopy(artifact['model'])
+        rmse_before = float(np.sqrt(mean_squared_error(y[recent], model.predict(X_scaled[recent]))))
+        if rmse_before > (1 + drift_tolerance) * artifact['metrics']['rmse']:
+            logger.info(f"Drift detected: RMSE on {n_recent} recent clients = {rmse_before:.2f} "
+                        f"vs {artifact['metrics']['rmse']:.2f} at training")
+            return None
+        
+        # Clients de contrôle tirés parmi tous les clients, récents ou non ; ajustement sur les autres clients récents
+        known = ~np.isnan(y)
+        holdout = known & (np.random.default_rng(42).random(len(y)) < UPDATE_HOLDOUT)
+        train = recent & ~holdout
+        
+        model.set_params(warm_start=True, n_estimators=model.n_estimators_ + stages)
+        start = time.perf_counter()
+        model.fit(X_scaled[train], y[train])
+        training_time = time.perf_counter() - start
+        model.set_params(warm_start=False)
+        
+        # Contrôle après mise à jour : meilleur que le modèle précédent sur les clients récents de contrôle (inconnus
+        # des deux modèles), et pas de dérive sur l'ensemble des clients de contrôle, anciens compris
+        recent_holdout = holdout[recent]
+        recent_before = float(np.sqrt(mean_squared_error(
+            y[recent][recent_holdout], artifact['model'].predict(X_scaled[recent][recent_holdout]))))
+        recent_after = float(np.sqrt(mean_squared_error(
+            y[recent][recent_holdout], model.predict(X_scaled[recent][recent_holdout]))))
+        y_holdout = y[holdout]
+        y_pred = model.predict(X_scaled[holdout])
+        mse = mean_squared_error(y_holdout, y_pred)
+        if recent_after > recent_before or np.sqrt(mse) > (1 + drift_tolerance) * artifact['metrics']['rmse']:
+            logger.info(f"Update rejected: RMSE on {int(recent_holdout.sum())} held-out recent clients = "
+                        f"{recent_after:.2f} vs {recent_before:.2f} before the update, on all "
+                        f"{int(holdout.sum())} held-out clients = {np.sqrt(mse):.2f}")
+            return None
+        
+        metrics = {
+            'mse': mse,
+            'rmse': np.sqrt(mse),
+            'r2': r2_score(y_holdout, y_pred),
+            'mae': mean_absolute_error(y_holdout, y_pred),
+            'training_time': training_time,
+            'folds': [],
+            'update': {'recent_clients': int(train.sum()), 'holdout_clients': int(holdout.sum()),
+                       'stages_added': stages, 'total_stages_added': stages_added,
+                       'since': cutoff.strftime('%Y-%m-%d'), 'recent_rmse_before': rmse_before,
+                       'holdout_recent_rmse_before': recent_before, 'holdout_recent_rmse_after': recent_after}
+        }
+        logger.info(f"{artifact['model_name']}: updated on {int(train.sum())} recent clients, "
+                    f"held-out recent RMSE = {recent_before:.2f} -> {recent_after:.2f}, "
+                    f"held-out RMSE = {np.sqrt(mse):.2f}, R2 = {metrics['r2']:.4f}, "
+                    f"update time = {training_time:.3f}s")
+        return dict(artifact, model=model, metrics=metrics, stages_added=stages_added,
+                    data_cutoff=data_cutoff(df), fold_models=None, trained_at=None)
+    
+    except Exception as e:
+        logger.error(f"Error updating model: {str(e)}")
+        sys.exit(1)
+
+def predict_future_purchases(df, purchases_df, best_model, scaler, features, product_preferences, time_features, period='month', as_of=None):
+    """Predict future purchases for each client for the specified period, starting at as_of."""
+    predictions, model_accuracy = predict_horizons(
+        df, purchases_df, best_model, scaler, features, product_preferences, time_features, [period], as_of)
+    return predictions[period], model_accuracy
+
+def predict_horizons(df, purchases_df, best_model, scaler, features, product_preferences, time_features, periods=PERIODS, as_of=None):
+    """Predict future purchases for each client for several periods from a single model pass.
+    
+    Returns ({period: predictions}, model_accuracy).
+    """
+    scores, model_accuracy = score_clients(df, best_model, scaler, features, periods, as_of)
+    predictions = build_predictions(scores, range(len(df)), product_preferences, model_accuracy)
+    
+    # Sort by purchase probability (descending)
+    for period_predictions in predictions.values():
+        period_predictions.sort(key=lambda x: x['purchase_probability'], reverse=True)
+    
+    return predictions, model_accuracy
+
+def score_clients(df, best_model, scaler, features, periods=PERIODS, as_of=None):
+    """Score every client at once.
+    
+    Returns (scores, model_accuracy) where scores holds arrays aligned with
+    the rows of df, as consumed by build_predictions.
+    """
     try:
         # Prepare client data for prediction
         time_feature_cols = [col for col in df.columns if col.startswith('ts_')]
@@ -299,113 +362,123 @@ def predict_future_purchases(df, purchases_df, best_model, scaler, features, pro
         # Cap the model accuracy at 98% to be more realistic
         model_accuracy = min(98, raw_accuracy)
         
-        # Scale predictions based on period
-        period_factor = 1  # Default for month
-        if period == 'day':
-            period_factor = 1/30
-        elif period == 'week':
-            period_factor = 1/4
-        elif period == 'quarter':
-            period_factor = 3
-        
         # Calculate expected purchase date
-        current_date = datetime.now()
-        next_periods = {
-            'day': current_date + timedelta(days=1),
-            'week': current_date + timedelta(weeks=1),
-            'month': current_date + timedelta(days=30),
-            'quarter': current_date + timedelta(days=90)
+        current_date = feature_store.reference_date(as_of)
+        
+        # Per-client inputs as arrays aligned with the rows of df
+        n_clients = len(df)
+        client_ids = df['client_id'].astype(object).to_numpy()
+        names = df['nom'].astype(object).to_numpy() if 'nom' in df.columns else \
+            np.array([f"Client {client_id}" for client_id in client_ids], dtype=object)
+        segments = df['statut'].astype(object).to_numpy() if 'statut' in df.columns else \
+            np.full(n_clients, "Standard", dtype=object)
+        ts_features = {col.replace('ts_', ''): df[col].to_numpy(dtype=float) for col in time_feature_cols}
+        zeros = np.zeros(n_clients)
+        trends = ts_features.get('trend', zeros)
+        
+        # Calculate predicted metrics with adjustments based on time series features
+        base_amounts = np.maximum(0, predicted_amounts)
+        if ts_features:
+            # Adjust prediction based on trend (weight 2 for trend influence), no seasonality factor yet
+            trend_adjustments = trends * 2
+            seasonality_factor = 1.0
+            base_amounts = base_amounts * (1 + trend_adjustments / 100) * seasonality_factor
+        base_frequencies = predicted_frequencies.to_numpy(dtype=float)
+        
+        # Scale predictions based on period
+        horizons = {}
+        for period in periods:
+            period_factor = PERIOD_FACTORS[period]
+            horizons[period] = (
+                np.maximum(0, base_amounts * period_factor),
+                np.maximum(0, base_frequencies * period_factor),
+                (current_date + timedelta(days=PERIOD_DAYS[period])).strftime('%Y-%m-%d')
+            )
+        
+        # Calculate probability based on recency and frequency
+        days_since_last = (current_date - df['dernier_achat']).dt.days.to_numpy(dtype=float)
+        purchase_frequency = df['frequence_achat'].to_numpy(dtype=float)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            raw_probabilities = np.where(purchase_frequency > 0, 1 - days_since_last / (purchase_frequency * 2), 0.1)
+        purchase_probabilities = np.clip(np.nan_to_num(raw_probabilities, nan=0.05), 0.05, 0.95)
+        
+        # Custom accuracy boost when we have good time series data
+        good_history = ts_features.get('purchase_count', zeros) > 5 if ts_features else np.zeros(n_clients, dtype=bool)
+        
+        scores = {
+            'client_ids': client_ids,
+            'names': names,
+            'segments': segments,
+            'ts_features': ts_features,
+            'trends': trends,
+            'horizons': horizons,
+            'purchase_probabilities': purchase_probabilities,
+            'good_history': good_history
         }
+        return scores, model_accuracy
+    
+    except Exception as e:
+        logger.error(f"Error predicting future purchases: {str(e)}")
+        sys.exit(1)
+
+def build_predictions(scores, rows, product_preferences, model_accuracy):
+    """Build the prediction records of the given row positions, as {period: [predictions]} in row order.
+    
+    product_preferences is the index returned by feature_store.preference_index.
+    """
+    try:
+        index = product_preferences
+        ts_features = scores['ts_features']
+        trends = scores['trends']
+        zeros = np.zeros(len(scores['client_ids']))
         
         # Prepare results
-        predictions = []
-        
-        for i, client_id in enumerate(df['client_id']):
-            # Get client's time series features
-            client_ts_features = {
-                key.replace('ts_', ''): value for key, value in 
-                df.loc[df['client_id'] == client_id, time_feature_cols].iloc[0].items()
-            } if time_feature_cols else {}
-            
-            # Calculate predicted metrics with adjustments based on time series features
-            base_amount = max(0, predicted_amounts[i])
-            
-            # Apply time series adjustments if available
-            if client_ts_features:
-                # Adjust prediction based on trend
-                trend_adjustment = client_ts_features.get('trend', 0) * 2  # Weight for trend influence
-                
-                # Factor in seasonality if available
-                month_ahead = (current_date + timedelta(days=30 * period_factor)).month
-                seasonality_factor = 1.0  # Default
-                
-                # Apply adjustments
-                ts_adjusted_amount = base_amount * (1 + trend_adjustment/100) * seasonality_factor
-                predicted_amount = max(0, ts_adjusted_amount * period_factor)
-            else:
-                predicted_amount = max(0, base_amount * period_factor)
-            
-            predicted_frequency = max(0, predicted_frequencies[i] * period_factor)
-            
-            # Calculate probability based on recency and frequency
-            days_since_last = (current_date - df.loc[df['client_id'] == client_id, 'dernier_achat'].iloc[0]).days if not df.loc[df['client_id'] == client_id, 'dernier_achat'].empty else 365
-            purchase_probability = min(0.95, max(0.05, 1 - (days_since_last / (df.loc[df['client_id'] == client_id, 'frequence_achat'].iloc[0] * 2)) if df.loc[df['client_id'] == client_id, 'frequence_achat'].iloc[0] > 0 else 0.1))
-            
-            # Get customer segment if available
-            segment = df.loc[df['client_id'] == client_id, 'statut'].iloc[0] if 'statut' in df.columns else "Standard"
+        predictions = {period: [] for period in scores['horizons']}
+        
+        for i in rows:
+            client_id = scores['client_ids'][i]
             
             # Get predicted products
             predicted_products = []
             likely_categories = []
             
-            if client_id in product_preferences:
-                # Sort categories by frequency and total amount
-                sorted_categories = sorted(
-                    product_preferences[client_id].items(),
-                    key=lambda x: (x[1]['count'], x[1]['total_amount']), 
-                    reverse=True
-                )
-                
-                # Get top 3 categories
-                top_categories = sorted_categories[:3]
-                
-                for category_name, category_data in top_categories:
-                    # Sort products within category by frequency and amount
-                    sorted_products = sorted(
-                        category_data['products'].items(),
-                        key=lambda x: (x[1]['count'], x[1]['total_amount']),
-                        reverse=True
-                    )
-                    
-                    # Add top products (max 2 per category)
-                    top_products = sorted_products[:2]
+            row = index['rows'][i]
+            if row >= 0:
+                # Top 3 categories by frequency and total amount, then top 2 products of each
+                for entry in range(index['category_indptr'][row], index['category_indptr'][row + 1]):
+                    category_name = index['categories'][index['category_ids'][entry]]
+                    category_count = int(index['category_counts'][entry])
+                    top_products = [(index['products'][index['product_ids'][j]],
+                                     int(index['product_counts'][j]),
+                                     float(index['product_amounts'][j]))
+                                    for j in range(index['product_start'][entry], index['product_end'][entry])]
                     
                     category_info = {
                         'category': category_name,
-                        'purchase_count': category_data['count'],
-                        'total_spent': round(category_data['total_amount'], 2),
+                        'purchase_count': category_count,
+                        'total_spent': round(float(index['category_amounts'][entry]), 2),
                         'products': [{
                             'name': product_name,
-                            'purchase_count': product_data['count'],
-                            'avg_price': round(product_data['total_amount'] / product_data['count'], 2)
-                        } for product_name, product_data in top_products]
+                            'purchase_count': product_count,
+                            'avg_price': round(product_amount / product_count, 2)
+                        } for product_name, product_count, product_amount in top_products]
                     }
                     
                     likely_categories.append(category_info)
                     
-                    for product_name, product_data in top_products:
+                    for product_name, product_count, product_amount in top_products:
                         predicted_products.append({
                             'name': product_name,
                             'category': category_name,
-                            'likelihood': min(0.95, product_data['count'] / max(1, category_data['count'])),
-                            'avg_price': round(product_data['total_amount'] / product_data['count'], 2)
+                            'likelihood': min(0.95, product_count / max(1, category_count)),
+                            'avg_price': round(product_amount / product_count, 2)
                         })
             
             # Add custom accuracy adjustment based on data quality
             data_quality_adjustment = 1.0
             if len(predicted_products) < 3:
                 data_quality_adjustment = 0.8  # If we don't have enough product data
-            elif client_ts_features and client_ts_features.get('purchase_count', 0) > 5:
+            elif scores['good_history'][i]:
                 data_quality_adjustment = 1.1  # Boost confidence if we have good time series data
             
             # Calculate amount prediction accuracy - combine model performance with data quality
@@ -414,59 +487,159 @@ def predict_future_purchases(df, purchases_df, best_model, scaler, features, pro
             
             # Add time series insights
             time_series_insights = {}
-            if client_ts_features:
+            if ts_features:
                 time_series_insights = {
-                    'trend': 'increasing' if client_ts_features.get('trend', 0) > 0 else 
-                             'decreasing' if client_ts_features.get('trend', 0) < 0 else 'stable',
-                    'avg_purchase': round(client_ts_features.get('avg_purchase', 0), 2),
-                    'volatility': round(client_ts_features.get('volatility', 0), 2),
-                    'purchase_history': client_ts_features.get('purchase_count', 0)
+                    'trend': 'increasing' if trends[i] > 0 else 'decreasing' if trends[i] < 0 else 'stable',
+                    'avg_purchase': round(float(ts_features.get('avg_purchase', zeros)[i]), 2),
+                    'volatility': round(float(ts_features.get('volatility', zeros)[i]), 2),
+                    'purchase_history': float(ts_features.get('purchase_count', zeros)[i])
                 }
             
-            client_prediction = {
-                'client_id': client_id,
-                'nom': df.loc[df['client_id'] == client_id, 'nom'].iloc[0] if 'nom' in df.columns else f"Client {client_id}",
-                'segment': segment,
-                'predicted_amount': round(predicted_amount, 2),
-                'predicted_frequency': round(predicted_frequency, 2),
-                'purchase_probability': round(purchase_probability, 2),
-                'expected_purchase_date': next_periods[period].strftime('%Y-%m-%d'),
-                'prediction_period': period,
-                'amount_accuracy': adjusted_amount_accuracy,
-                'predicted_products': predicted_products,
-                'likely_categories': likely_categories,
-                'time_series_insights': time_series_insights
-            }
-            
-            predictions.append(client_prediction)
-        
-        # Sort by purchase probability (descending)
-        predictions.sort(key=lambda x: x['purchase_probability'], reverse=True)
+            # Only the period-scaled values differ between horizons
+            purchase_probability = round(float(scores['purchase_probabilities'][i]), 2)
+            for period, (predicted_amounts, predicted_frequencies, expected_date) in scores['horizons'].items():
+                client_prediction = {
+                    'client_id': client_id,
+                    'nom': scores['names'][i],
+                    'segment': scores['segments'][i],
+                    'predicted_amount': round(float(predicted_amounts[i]), 2),
+                    'predicted_frequency': round(float(predicted_frequencies[i]), 2),
+                    'purchase_probability': purchase_probability,
+                    'expected_purchase_date': expected_date,
+                    'prediction_period': period,
+                    'amount_accuracy': adjusted_amount_accuracy,
+                    'predicted_products': predicted_products,
+                    'likely_categories': likely_categories,
+                    'time_series_insights': time_series_insights
+                }
+                
+                predictions[period].append(client_prediction)
         
-        return predictions, model_accuracy
+        return predictions
     
     except Exception as e:
         logger.error(f"Error predicting future purchases: {str(e)}")
         sys.exit(1)
 
+def top_k_rows(probabilities, k):
+    """Row positions of the k most likely buyers, by descending rounded probability then row order.
+    
+    Same order as a full stable sort of the predictions, but only the k
+    selected rows are sorted.
+    """
+    keys = np.round(probabilities, 2)
+    if k >= len(keys):
+        return np.lexsort((np.arange(len(keys)), -keys))
+    
+    # Rows strictly above the k-th value, completed with the first rows equal to it
+    threshold = np.partition(keys, len(keys) - k)[len(keys) - k]
+    above = np.flatnonzero(keys > threshold)
+    ties = np.flatnonzero(keys == threshold)[:k - len(above)]
+    rows = np.concatenate([above, ties])
+    return rows[np.lexsort((rows, -keys[rows]))]
+
+def write_batch_predictions(path, scores, product_preferences, model_accuracy, batch_size=DEFAULT_BATCH_SIZE):
+    """Write the predictions of every client to path, batch_size clients at a time.
+    
+    A .jsonl / .ndjson path receives one JSON record per client and period;
+    any other path is a directory receiving one columnar part-NNNNN.npz file
+    per batch (nested fields stored as JSON text, see ingestion.save_table).
+    Records are written in row order; ranking is left to top_k_rows.
+    """
+    try:
+        n_clients = len(scores['client_ids'])
+        json_lines = path.lower().endswith(ingestion.JSON_LINES_EXTENSIONS)
+        if json_lines:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            output = open(path, 'w', encoding='utf-8')
+        else:
+            os.makedirs(path, exist_ok=True)
+        
+        try:
+            for part, start in enumerate(range(0, n_clients, batch_size)):
+                predictions = build_predictions(scores, range(start, min(start + batch_size, n_clients)),
+                                                product_preferences, model_accuracy)
+                records = [record for period_predictions in predictions.values() for record in period_predictions]
+                if json_lines:
+                    output.writelines(json.dumps(record) + '\n' for record in records)
+                else:
+                    ingestion.save_table(os.path.join(path, f"part-{part:05d}.npz"), pd.DataFrame.from_records(records))
+        finally:
+            if json_lines:
+                output.close()
+        
+        logger.info(f"Wrote predictions of {n_clients} clients to {path}")
+    
+    except Exception as e:
+        logger.error(f"Error writing batch predictions: {str(e)}")
+        sys.exit(1)
+
+def parse_periods(value):
+    """argparse type of the --periods option: comma-separated periods or 'all'."""
+    if value == 'all':
+        return list(PERIODS)
+    periods = list(dict.fromkeys(p.strip() for p in value.split(',') if p.strip()))
+    unknown = [p for p in periods if p not in PERIODS]
+    if unknown or not periods:
+        raise argparse.ArgumentTypeError(f"invalid periods {value!r}, expected 'all' or a list of {', '.join(PERIODS)}")
+    return periods
+
+def parse_positive_int(value):
+    """argparse type of the --batch-size and --top-k options: an integer >= 1."""
+    try:
+        number = int(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid value {value!r}, expected a positive integer")
+    if number < 1:
+        raise argparse.ArgumentTypeError(f"invalid value {value!r}, expected a positive integer")
+    return number
+
 def main():
     parser = argparse.ArgumentParser(description='Customer Purchase Prediction')
-    parser.add_argument('--loyalty', required=True, help='Path to the loyalty points JSON file')
-    parser.add_argument('--purchases', required=True, help='Path to the purchases JSON file')
-    parser.add_argument('--period', choices=['day', 'week', 'month', 'quarter'], default='month', 
+    parser.add_argument('--loyalty', required=True, help='Path to the loyalty points JSON or JSON Lines file')
+    parser.add_argument('--purchases', required=True, help='Path to the purchases JSON or JSON Lines file, or a directory / glob pattern of daily exports')
+    parser.add_argument('--period', choices=PERIODS, default='month', 
                         help='Prediction period (day, week, month, quarter)')
+    parser.add_argument('--periods', type=parse_periods, default=None,
+                        help='Comma-separated periods (or "all") predicted in the same run, returned in predictions_by_period')
     parser.add_argument('--features', default='age,points_cumules,nombre_achats,points_actuels', 
                       help='Comma-separated list of features to use for prediction')
     parser.add_argument('--use-time-series', action='store_true', 
                       help='Whether to use time series features for prediction')
+    parser.add_argument('--as-of', type=feature_store.parse_as_of, default=None,
+                        help='Reference date (YYYY-MM-DD) for recency features and predicted dates, defaults to today')
+    parser.add_argument('--model', default=None,
+                        help='Path of a trained model artifact to use instead of training')
+    parser.add_argument('--predict-only', action='store_true',
+                        help='Only predict with the registered model for this data, fail if none was trained')
+    parser.add_argument('--retrain', action='store_true',
+                        help='Train a new model even if the registry already holds one for this data')
+    parser.add_argument('--update', action='store_true',
+                        help='Without a registered model for this data, warm-start the last model of this configuration with the recent clients (full retrain on drift)')
+    parser.add_argument('--output', default=None,
+                        help='Batch mode: write all predictions to a JSON Lines file (.jsonl) or a directory of columnar .npz parts')
+    parser.add_argument('--batch-size', type=parse_positive_int, default=DEFAULT_BATCH_SIZE,
+                        help='Number of clients whose records are built and written per batch with --output '
+                             '(the model scores every client in one vectorized pass)')
+    parser.add_argument('--top-k', type=parse_positive_int, default=None,
+                        help=f'Only return the k most likely buyers (default {DEFAULT_TOP_K} with --output)')
+    parser.add_argument('--engine', choices=sorted(ENGINES), default='gbr',
+                        help='Boosting engine: gbr (exact splits) or hist (histogram-based with early stopping)')
+    parser.add_argument('--tune', action='store_true',
+                        help='Search the engine hyperparameters (successive halving over the time series folds) and cache the best ones for this data')
+    parser.add_argument('--keep-fold-models', action='store_true',
+                        help='Keep the cross-validation fold models in the saved model artifact')
+    ingestion.add_ingestion_arguments(parser)
     
     args = parser.parse_args()
+    as_of = feature_store.reference_date(args.as_of)
     
     # Parse features list
     feature_list = args.features.split(',')
     
     # Load and prepare data
-    df, purchases_df, product_preferences, time_features = load_data(args.loyalty, args.purchases)
+    df, purchases_df, product_preferences, time_features = load_data(
+        args.loyalty, args.purchases, as_of=as_of, **ingestion.ingestion_options(args))
     
     # Ensure all requested features exist in the dataframe
     valid_features = [f for f in feature_list if f in df.columns]
@@ -474,34 +647,149 @@ def main():
         logger.error("Error: None of the specified features exist in the data")
         sys.exit(1)
     
-    # Standard prediction workflow
-    # Prepare data for prediction
-    X_scaled, y_amount, y_frequency, final_features, scaler = prepare_prediction_data(
-        df, valid_features, use_time_series=True)
+    ingest_options = ingestion.ingestion_options(args)
+    registry_dir = model_registry.registry_dir(ingest_options['cache_dir'])
+    data_version = ingestion.data_version(args.loyalty, args.purchases, ingest_options['cache_dir'],
+                                          args.incremental) if registry_dir else None
+    if data_version and any(f in feature_store.RECENCY_FEATURES for f in valid_features):
+        # Variables calculées à partir de la date de référence : un modèle par date
+        data_version = f"{data_version}@{as_of.strftime('%Y-%m-%d')}"
+    dtype = np.float32 if args.compact else np.float64
+    prepared = None
+    
+    # Hyperparameters: tuned for this data version (--tune, or cached by a previous search) or engine defaults
+    params = dict(ENGINES[args.engine][2])
+    tuning_path = None
+    if registry_dir:
+        tuning_key = model_registry.model_key(
+            data_version, {'engine': args.engine, 'grid': TUNING_GRIDS[args.engine], 'dtype': np.dtype(dtype).name},
+            valid_features)
+        tuning_path = model_registry.tuning_path(registry_dir, tuning_key)
+    if args.tune:
+        prepared = prepare_prediction_data(df, valid_features, use_time_series=True, dtype=dtype)
+        tuned_params = tune_hyperparameters(prepared[0], prepared[1], args.engine)
+        if tuning_path:
+            model_registry.save_tuned_params(tuning_path, tuned_params)
+    else:
+        tuned_params = model_registry.load_tuned_params(tuning_path) if tuning_path else None
+    params.update(tuned_params or {})
+    
+    # Look up a trained model: explicit artifact, registry entry, or train a new one
+    hyperparameters = dict(params, engine=args.engine, dtype=np.dtype(dtype).name)
+    artifact = None
+    artifact_path = args.model
+    config_key = None
+    if args.model:
+        artifact = model_registry.load_model(args.model)
+        if artifact is None:
+            logger.error(f"Error: Model file {args.model} not found or unreadable")
+            sys.exit(1)
+    elif registry_dir:
+        key = model_registry.model_key(data_version, hyperparameters, valid_features)
+        artifact_path = model_registry.model_path(registry_dir, key)
+        if not args.retrain:
+            artifact = model_registry.load_model(artifact_path)
+        
+        # Mise à jour incrémentale du dernier modèle de cette configuration (autre version des données)
+        config_key = model_registry.model_key(None, hyperparameters, valid_features)
+        if artifact is None and args.update and not args.retrain:
+            base_path, base = model_registry.latest_model(registry_dir, config_key)
+            if base is None:
+                logger.info("No previous model for this configuration, training from scratch")
+            else:
+                logger.info(f"Updating model {base_path} ({base['trained_at']})")
+                missing = [f for f in base['features_used'] if f not in df.columns]
+                artifact = None if missing else update_model(base, df, dtype)
+                if artifact is not None:
+                    artifact['updated_from'] = base_path
+                    artifact = model_registry.save_model(artifact_path, artifact)
+                    model_registry.set_latest_model(registry_dir, config_key, artifact_path)
+    
+    if artifact is None and args.predict_only:
+        logger.error("Error: No trained model for this data and configuration, run without --predict-only first")
+        sys.exit(1)
+    
+    if artifact is None:
+        # Standard prediction workflow
+        # Prepare data for prediction
+        X_scaled, y_amount, y_frequency, final_features, scaler = prepared or prepare_prediction_data(
+            df, valid_features, use_time_series=True, dtype=dtype)
+        
+        # Train and evaluate Gradient Boosting model
+        best_model, best_model_name, best_metrics, all_models, all_models_metrics, fold_models = evaluate_models(
+            X_scaled, y_amount, time_series=True, params=params, keep_fold_models=args.keep_fold_models,
+            engine=args.engine)
+        
+        artifact = {
+            'model': best_model,
+            'model_name': best_model_name,
+            'scaler': scaler,
+            'features': valid_features,
+            'features_used': final_features,
+            'metrics': best_metrics,
+            'model_comparison': all_models_metrics,
+            'hyperparameters': hyperparameters,
+            'fold_models': fold_models,
+            'data_cutoff': data_cutoff(df)
+        }
+        if artifact_path:
+            artifact = model_registry.save_model(artifact_path, artifact)
+        if config_key:
+            model_registry.set_latest_model(registry_dir, config_key, artifact_path)
+    else:
+        logger.info(f"Using trained model {artifact_path} ({artifact['trained_at']})")
+        missing = [f for f in artifact['features_used'] if f not in df.columns]
+        if missing:
+            logger.error(f"Error: Features of the trained model missing from the data: {', '.join(missing)}")
+            sys.exit(1)
     
-    # Train and evaluate Gradient Boosting model
-    best_model, best_model_name, best_metrics, all_models, all_models_metrics = evaluate_models(
-        X_scaled, y_amount, time_series=True)
+    best_metrics = artifact['metrics']
     
-    # Make predictions for the specified period
-    predictions, model_accuracy = predict_future_purchases(
-        df, purchases_df, best_model, scaler, valid_features, 
-        product_preferences, time_features, args.period)
+    # Make predictions for the specified period(s) with a single model pass
+    periods = args.periods or [args.period]
+    period = args.period if args.period in periods else periods[0]
+    if args.output or args.top_k is not None:
+        # Batch scoring: arrays for every client, records written in chunks, only the top-k kept for the response
+        scores, model_accuracy = score_clients(df, artifact['model'], artifact['scaler'], artifact['features'],
+                                               periods, as_of)
+        if args.output:
+            write_batch_predictions(args.output, scores, product_preferences, model_accuracy, args.batch_size)
+        top_rows = top_k_rows(scores['purchase_probabilities'], DEFAULT_TOP_K if args.top_k is None else args.top_k)
+        predictions_by_period = build_predictions(scores, top_rows, product_preferences, model_accuracy)
+    else:
+        predictions_by_period, model_accuracy = predict_horizons(
+            df, purchases_df, artifact['model'], artifact['scaler'], artifact['features'], 
+            product_preferences, time_features, periods, as_of)
+    predictions = predictions_by_period[period]
     
     # Prepare results
     results = {
         'predictions': predictions,
         'model_metrics': {
-            'best_model': best_model_name,
+            'best_model': artifact['model_name'],
             'r2_score': round(best_metrics['r2'], 4),
             'rmse': round(best_metrics['rmse'], 2),
             'mae': round(best_metrics['mae'], 2),
+            'training_time': round(best_metrics['training_time'], 3),
+            'hyperparameters': artifact['hyperparameters'],
         },
-        'features_used': final_features,
-        'prediction_period': args.period,
+        'features_used': artifact['features_used'],
+        'prediction_period': period,
+        'as_of': as_of.strftime('%Y-%m-%d'),
         'amount_accuracy': model_accuracy,
-        'model_comparison': all_models_metrics
+        'model_comparison': artifact['model_comparison'],
+        'trained_at': artifact.get('trained_at')
     }
+    if 'update' in best_metrics:
+        results['model_metrics']['update'] = {key: round(value, 2) if isinstance(value, float) else value
+                                              for key, value in best_metrics['update'].items()}
+        results['updated_from'] = artifact.get('updated_from')
+    if args.output:
+        results['output'] = args.output
+        results['scored_clients'] = len(df)
+    if args.periods:
+        results['prediction_periods'] = periods
+        results['predictions_by_period'] = predictions_by_period
     
     # Output JSON results
     sys.stdout.write(json.dumps(results))
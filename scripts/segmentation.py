@@ -0,0 +1,116 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Clustering engines shared by the segmentation scripts.
+
+'kmeans' runs full-batch KMeans with 10 restarts. 'minibatch' fits a
+MiniBatchKMeans on random mini-batches of the matrix.
+
+fit_projection computes the 2-D projection of the visualization with the
+PCA solver picked by scikit-learn or with an exact, randomized or
+incremental PCA.
+
+sweep_clusters fits a range of cluster counts in parallel worker processes
+and scores each with the silhouette of a fixed random subsample.
+"""
+
+import argparse
+import numpy as np
+from joblib import Parallel, delayed
+from sklearn.cluster import KMeans, MiniBatchKMeans
+from sklearn.decomposition import PCA, IncrementalPCA
+from sklearn.metrics import silhouette_score
+
+CLUSTERING_ENGINES = ('kmeans', 'minibatch')
+PCA_SOLVERS = ('auto', 'exact', 'randomized', 'incremental')
+
+# Lignes par mini-lot (moteur minibatch et PCA incrémentale)
+DEFAULT_BATCH_SIZE = 1024
+
+# Balayage de k (--sweep) : plage par défaut et taille de l'échantillon du score silhouette (O(n²))
+DEFAULT_SWEEP = '2-10'
+SILHOUETTE_SAMPLE = 2000
+
+def add_clustering_arguments(parser):
+    """Register the clustering engine options shared by the segmentation scripts."""
+    parser.add_argument('--engine', choices=CLUSTERING_ENGINES, default='kmeans',
+                        help='Clustering engine: kmeans (full batch, 10 restarts) or minibatch (MiniBatchKMeans with early stopping)')
+    parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE,
+                        help='Rows per mini-batch of the minibatch engine and per chunk of the incremental PCA')
+
+def parse_k_range(value):
+    """argparse type of the --sweep option: a range of cluster counts 'MIN-MAX' (MIN >= 2)."""
+    try:
+        low, high = (int(bound) for bound in value.split('-'))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid range {value!r}, expected MIN-MAX")
+    if low < 2 or high < low:
+        raise argparse.ArgumentTypeError(f"invalid range {value!r}, expected 2 <= MIN <= MAX")
+    return list(range(low, high + 1))
+
+def matrix_chunks(X, batch_size=DEFAULT_BATCH_SIZE):
+    """Return a function yielding the rows of X in chunks; each call starts a new pass over X."""
+    def chunks():
+        for start in range(0, len(X), batch_size):
+            yield X[start:start + batch_size]
+    return chunks
+
+def fit_clusters(X, n_clusters, engine='kmeans', batch_size=DEFAULT_BATCH_SIZE, random_state=42):
+    """Cluster the rows of X with an engine of CLUSTERING_ENGINES.
+
+    Returns (labels, cluster centers, inertia).
+    """
+    if engine == 'minibatch':
+        # fit de MiniBatchKMeans (arrêt anticipé intégré)
+        model = MiniBatchKMeans(n_clusters=n_clusters, batch_size=batch_size, random_state=random_state, n_init=3)
+        labels = model.fit_predict(X)
+        return labels, model.cluster_centers_, model.inertia_
+
+    kmeans = KMeans(n_clusters=n_clusters, random_state=random_state, n_init=10)
+    labels = kmeans.fit_predict(X)
+    return labels, kmeans.cluster_centers_, kmeans.inertia_
+
+def fit_projection(X, n_components=2, solver='auto', batch_size=DEFAULT_BATCH_SIZE, random_state=42):
+    """Fit a PCA of X with a solver of PCA_SOLVERS and return (projected X, fitted PCA).
+
+    'auto' keeps the PCA solver chosen by scikit-learn for the shape of X
+    (possibly a randomized SVD on large matrices), 'exact' forces a full SVD,
+    'randomized' forces a randomized SVD computing only the first components
+    and 'incremental' fits and applies an IncrementalPCA chunk by chunk.
+    """
+    if solver == 'incremental':
+        pca = IncrementalPCA(n_components=n_components, batch_size=batch_size)
+        chunks = matrix_chunks(X, max(batch_size, n_components))
+        for chunk in chunks():
+            if len(chunk) >= n_components:
+                pca.partial_fit(chunk)
+        return np.vstack([pca.transform(chunk) for chunk in chunks()]), pca
+
+    svd_solvers = {'auto': 'auto', 'exact': 'full', 'randomized': 'randomized'}
+    pca = PCA(n_components=n_components, svd_solver=svd_solvers[solver], random_state=random_state)
+    return pca.fit_transform(X), pca
+
+def _sweep_point(X, k, engine, batch_size, sample):
+    labels, _, inertia = fit_clusters(X, k, engine, batch_size)
+    return {
+        'k': k,
+        'inertia': round(float(inertia), 2),
+        'silhouette': round(float(silhouette_score(X[sample], labels[sample])), 4)
+    }
+
+def sweep_clusters(X, k_values, engine='kmeans', batch_size=DEFAULT_BATCH_SIZE, sample_size=SILHOUETTE_SAMPLE,
+                   workers=0, random_state=42):
+    """Fit every k of k_values in parallel and score it on the same subsample of sample_size rows.
+
+    Worker processes (0 = one per CPU) share X through joblib memory mapping.
+    Returns {'curve': [{k, inertia, silhouette}], 'recommended_k'}, the
+    recommended k having the best silhouette.
+    """
+    k_values = [k for k in k_values if k < len(X)]
+    sample = np.random.default_rng(random_state).permutation(len(X))[:sample_size]
+    curve = Parallel(n_jobs=workers or -1)(
+        delayed(_sweep_point)(X, k, engine, batch_size, sample) for k in k_values)
+    return {
+        'curve': curve,
+        'recommended_k': max(curve, key=lambda point: point['silhouette'])['k'] if curve else None,
+        'silhouette_sample': int(len(sample))
+    }
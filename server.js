@@ -95,16 +95,31 @@ app.post('/api/clustering', (req, res) => {
   }
   
   // Get parameters from request
-  const { numClusters = 3, features = ['age', 'points_cumules', 'nombre_achats'] } = req.body;
+  const { numClusters = 3, features = ['age', 'points_cumules', 'nombre_achats'], engine = 'kmeans', sweep,
+          lod = 'sample', maxPoints = 5000, pcaSolver = 'auto' } = req.body;
   
-  // Run Python script as a child process
-  const python = spawn('python', [
+  // Bounded visualization payload by default: stratified sample of maxPoints points ('full' for every point, 'grid' for density grids)
+  const args = [
     pythonScript,
     '--loyalty', loyaltyPath,
     '--purchases', purchasesPath,
     '--clusters', numClusters.toString(),
-    '--features', features.join(',')
-  ]);
+    '--features', features.join(','),
+    '--engine', engine,
+    '--lod', lod,
+    '--max-points', maxPoints.toString(),
+    '--pca-solver', pcaSolver
+  ];
+  // Choice of k: true for the default range, or 'MIN-MAX' (k_sweep in the response)
+  if (sweep) {
+    args.push('--sweep');
+    if (typeof sweep === 'string') {
+      args.push(sweep);
+    }
+  }
+  
+  // Run Python script as a child process
+  const python = spawn('python', args);
   
   let dataFromPython = '';
   let errorFromPython = '';
@@ -155,16 +170,27 @@ app.post('/api/prediction', (req, res) => {
   }
   
   // Get parameters from request
-  const { period = 'month', features = ['age', 'points_cumules', 'nombre_achats', 'points_actuels'] } = req.body;
+  const { period = 'month', features = ['age', 'points_cumules', 'nombre_achats', 'points_actuels'], asOf, engine = 'gbr', periods } = req.body;
   
-  // Run Python script as a child process
-  const python = spawn('python', [
+  const args = [
     pythonScript,
     '--loyalty', loyaltyPath,
     '--purchases', purchasesPath,
     '--period', period,
-    '--features', features.join(',')
-  ]);
+    '--features', features.join(','),
+    '--engine', engine
+  ];
+  // Reference date (YYYY-MM-DD) of the prediction, today by default
+  if (asOf) {
+    args.push('--as-of', asOf);
+  }
+  // Several horizons in one run: 'all' or a list of periods (predictions_by_period)
+  if (periods) {
+    args.push('--periods', Array.isArray(periods) ? periods.join(',') : periods);
+  }
+  
+  // Run Python script as a child process
+  const python = spawn('python', args);
   
   let dataFromPython = '';
   let errorFromPython = '';
@@ -215,14 +241,15 @@ app.post('/api/loyalty-recommendations', (req, res) => {
   }
   
   // Get parameters from request
-  const { segments = 5 } = req.body;
+  const { segments = 5, engine = 'kmeans' } = req.body;
   
   // Run Python script as a child process
   const python = spawn('python', [
     pythonScript,
     '--loyalty', loyaltyPath,
     '--purchases', purchasesPath,
-    '--segments', segments.toString()
+    '--segments', segments.toString(),
+    '--engine', engine
   ]);
   
   let dataFromPython = '';
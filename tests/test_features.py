@@ -0,0 +1,34 @@
+# -*- coding: utf-8 -*-
+"""Regression tests of the feature store."""
+
+import json
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'scripts'))
+import features  # noqa: E402
+
+LOYALTY = [
+    {"client_id": "C1", "age": 30, "date_inscription": "2024-01-10", "dernier_achat": "2024-06-01",
+     "nombre_achats": 2, "points_cumules": 120, "statut": "Bronze"},
+    {"client_id": "C2", "age": 45, "date_inscription": "2023-05-02", "dernier_achat": "2024-05-20",
+     "nombre_achats": 5, "points_cumules": 480, "statut": "Argent"},
+]
+
+@pytest.mark.parametrize('purchases', [
+    [],
+    [{"Client_ID": "C1", "Date_Achat": "2024-06-01", "Total_Achat (€)": 42.5, "Nombre_Produits": 2}]
+], ids=['empty-export', 'no-produits'])
+def test_feature_table_without_categories(tmp_path, purchases):
+    loyalty_path = tmp_path / 'loyalty.json'
+    purchases_path = tmp_path / 'purchases.json'
+    loyalty_path.write_text(json.dumps(LOYALTY))
+    purchases_path.write_text(json.dumps(purchases))
+
+    table, _ = features.load_feature_table(str(loyalty_path), str(purchases_path), cache_dir=None)
+
+    assert len(table) == len(LOYALTY)
+    assert (table['categorie_preferee'] == 'Inconnue').all()
+    assert not [c for c in table.columns if c.startswith(features.CATEGORY_PREFIX)]